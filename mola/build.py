@@ -2,14 +2,82 @@
 Module to build a concrete model from a Specification object
 """
 import json
-from tempfile import NamedTemporaryFile
 import re
 import importlib
 
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
+import scipy.sparse as sparse
+from pygeodesy import R_M
 from pyomo.environ import units as pu
+from pyomo.dataportal.factory import DataManagerFactory
+from pyomo.dataportal.plugins.db_table import sqlite3_db_Table
+from pyomo.dataportal.plugins.json_dict import tuplize
 
 import mola.utils as mu
+import mola.dataimport as di
+
+
+@DataManagerFactory.register('mola_sqlite3', 'sqlite3 database interface using a pooled connection')
+class PooledSqliteTable(sqlite3_db_Table):
+    """
+    DataPortal data manager that reuses the connection opened by sqlite_pool for its file and records
+    the time spent on each query.
+    """
+    connections = {}
+    query_times = []
+
+    def connect(self, connection, options):
+        if connection in PooledSqliteTable.connections:
+            return PooledSqliteTable.connections[connection]
+        return sqlite3_db_Table.connect(self, connection, options)
+
+    def read(self):
+        start = time.perf_counter()
+        sqlite3_db_Table.read(self)
+        PooledSqliteTable.query_times.append((self.options.query, time.perf_counter() - start))
+
+
+@contextmanager
+def sqlite_pool(db_file, mmap_size=2 ** 30):
+    """
+    Open one read-only memory-mapped connection to db_file that is shared by all
+    DataPortal loads using 'mola_sqlite3' until the context exits.
+
+    :param db_file: full path to database file
+    :param int mmap_size: maximum number of bytes of the database file to memory map
+    :return: pooled connection, the loads record (query, seconds) tuples in PooledSqliteTable.query_times
+    """
+    conn = di.get_sqlite_read_connection(db_file, mmap_size)
+    PooledSqliteTable.connections[db_file] = conn
+    PooledSqliteTable.query_times = []
+    try:
+        yield conn
+    finally:
+        del PooledSqliteTable.connections[db_file]
+        conn.close()
+
+
+def load_data(data_portal, data):
+    """
+    Load model data into a DataPortal from a json file or straight from a dict in the same form,
+    which avoids writing and parsing a temporary file.
+
+    :param pyomo.dataportal.DataPortal data_portal: DataPortal
+    :param data: json file name or dict of sets and parameters in json configuration form or ParameterTables
+    :return: None
+    """
+    if isinstance(data, dict):
+        # same conversion as the DataPortal json plugin
+        for name, value in data.items():
+            value = value.to_dict() if isinstance(value, mu.ParameterTable) else tuplize(value)
+            data_portal.__setitem__(name, value if type(value) is dict else {None: value})
+    else:
+        data_portal.load(filename=data)
 
 
 def get_config(json_file_name):
@@ -37,7 +105,7 @@ def get_config(json_file_name):
     parameters = spec.get_default_parameters(sets)
     if 'indexed_sets' in config:
         indexed_sets.update(config['indexed_sets'])
-    parameters.update(config['parameters'])
+    update_parameters(parameters, config['parameters'], spec)
 
     # copy back to config dict
     config['sets'] = sets
@@ -62,28 +130,17 @@ def build_instance(config, settings=None):
     if settings is None and 'settings' in config:
         settings = config['settings']
     spec = create_specification(config['specification'], settings)
+    parameters = config['parameters']
+    if spec.settings.get('sparse_parameters'):
+        parameters = get_sparse_parameters(parameters, spec)
 
-    # write out temp json files for sets, indexed sets and parameters for DataPortal
-    sets_json = NamedTemporaryFile(suffix='.json', delete=False)
-    indexed_sets_json = NamedTemporaryFile(suffix='.json', delete=False)
-    parameters_json = NamedTemporaryFile(suffix='.json', delete=False)
-    json_list = [sets_json.name, parameters_json.name]
-    with open(sets_json.name, 'w') as fp:
-        json.dump(config['sets'], fp)
+    # pass sets, indexed sets and parameters straight to the DataPortal in populate
+    data_list = [config['sets'], parameters]
     if 'indexed_sets' in config and len(config['indexed_sets']) > 0:
-        with open(indexed_sets_json.name, 'w') as fp:
-            json.dump(config['indexed_sets'], fp)
-        json_list.append(indexed_sets_json.name)
-    with open(parameters_json.name, 'w') as fp:
-        json.dump(config['parameters'], fp)
-
-    sets_json.close()
-    indexed_sets_json.close()
-    parameters_json.close()
-
-    # populate sets and parameters using DataPortal and temp files
-    concrete_model = spec.populate(json_list)
+        data_list.append(config['indexed_sets'])
 
+    # populate sets and parameters using DataPortal
+    concrete_model = spec.populate(data_list)
 
     return concrete_model
 
@@ -111,6 +168,111 @@ def create_specification(spec_class, settings=None):
     return spec
 
 
+@lru_cache(maxsize=16)
+def get_haversine_distances(process_coordinates, task_coordinates, radius=R_M):
+    """
+    Calculate the haversine distances between process and task locations as a matrix. The coordinates are
+    tuples so that the result is memoised across builds while the locations do not change.
+
+    :param tuple process_coordinates: tuple of (latitude, longitude) of processes in degrees
+    :param tuple task_coordinates: tuple of (latitude, longitude) of tasks in degrees
+    :param float radius: mean earth radius in metres
+    :return: read-only numpy array of distances in km with a row per process and a column per task
+    """
+    lat1, lon1 = np.radians(np.array(process_coordinates, dtype=float).reshape(-1, 2)).T
+    lat2, lon2 = np.radians(np.array(task_coordinates, dtype=float).reshape(-1, 2)).T
+    a = np.sin((lat2[None, :] - lat1[:, None]) / 2) ** 2 + \
+        np.cos(lat1[:, None]) * np.cos(lat2[None, :]) * np.sin((lon2[None, :] - lon1[:, None]) / 2) ** 2
+    distances = 2 * np.arcsin(np.sqrt(np.minimum(a, 1))) * radius / 1000
+    distances.flags.writeable = False
+
+    return distances
+
+
+def get_sparse_parameters(parameters, spec):
+    """
+    Drop the zero values of the sparse parameters of a specification, which default to zero in the model.
+
+    :param dict parameters: parameters in index-value form or ParameterTables
+    :param Specification spec: Specification object
+    :return: dict of parameters
+    """
+    sparse_parameters = getattr(spec, 'sparse_parameters', [])
+    sparse = {}
+    for p, v in parameters.items():
+        if p not in sparse_parameters:
+            sparse[p] = v
+        elif isinstance(v, mu.ParameterTable):
+            sparse[p] = v.get_nonzero()
+        else:
+            sparse[p] = [iv for iv in v if iv['value'] != 0]
+    return sparse
+
+
+def update_parameters(parameters, new_parameters, spec):
+    """
+    Update parameters in index-value form with new parameters. The values of the sparse parameters of a
+    specification are set index by index, so that a configuration holding only nonzero values keeps
+    the default entries for the other indices.
+
+    :param dict parameters: parameters to update
+    :param dict new_parameters: new parameters
+    :param Specification spec: Specification object
+    :return: None
+    """
+    sparse_parameters = getattr(spec, 'sparse_parameters', [])
+    for p, v in new_parameters.items():
+        if p in sparse_parameters and p in parameters:
+            values = {tuple(iv['index']): iv['value'] for iv in v}
+            parameters[p] = [{'index': iv['index'], 'value': values.pop(tuple(iv['index']), iv['value'])}
+                             for iv in parameters[p]] + \
+                            [{'index': list(index), 'value': value} for index, value in values.items()]
+        else:
+            parameters[p] = v
+
+
+def build_ei_data(impact_factors, process_breakdown, kpi, flows, processes):
+    """
+    Build the impact parameter EI[kpi, f, p] = sum(Ef[kpi, e]*EF[e, f, p] for e in E) as the product of a
+    sparse characterisation matrix and a sparse inventory matrix.
+
+    :param dict impact_factors: Ef data keyed by (kpi, e)
+    :param dict process_breakdown: EF data keyed by (e, f, p)
+    :param list kpi: performance indicators in the model
+    :param list flows: flows in the model
+    :param list processes: processes in the model
+    :return: dict of the nonzero EI values keyed by (kpi, f, p)
+    """
+    kpi_index = {k: i for i, k in enumerate(kpi)}
+    flows = set(flows)
+    processes = set(processes)
+    e_index = {}
+    fp_index = {}
+
+    # inventory matrix of elementary flows against flow process pairs
+    b_row, b_col, b_val = [], [], []
+    for (e, f, p), v in process_breakdown.items():
+        if f in flows and p in processes and isinstance(v, (int, float)):
+            b_row.append(e_index.setdefault(e, len(e_index)))
+            b_col.append(fp_index.setdefault((f, p), len(fp_index)))
+            b_val.append(v)
+
+    # characterisation matrix of performance indicators against elementary flows
+    c_row, c_col, c_val = [], [], []
+    for (k, e), v in impact_factors.items():
+        if k in kpi_index and e in e_index and isinstance(v, (int, float)):
+            c_row.append(kpi_index[k])
+            c_col.append(e_index[e])
+            c_val.append(v)
+
+    c = sparse.csr_matrix((c_val, (c_row, c_col)), shape=(len(kpi_index), len(e_index)))
+    b = sparse.csr_matrix((b_val, (b_row, b_col)), shape=(len(e_index), len(fp_index)))
+    ei = (c @ b).tocoo()
+
+    fp_list = list(fp_index)
+    return {(kpi[i],) + fp_list[j]: v for i, j, v in zip(ei.row, ei.col, ei.data.tolist()) if v != 0}
+
+
 def build_parameters(sets, parameters, spec, index_value=False, indexed_sets=dict()):
     """
     Build a dictionary of DataFrames of default parameters from sets using existing parameter values.
@@ -127,20 +289,11 @@ def build_parameters(sets, parameters, spec, index_value=False, indexed_sets=dic
     for p, element_list in default_parameters.items():
         print(p + ': ' + spec.user_defined_parameters[p]['doc'])
         if 'index' in spec.user_defined_parameters[p]:
-            row_list = []
-            for el in element_list:
-                v = el['value']
-                # update if parameter was already defined
-                if p in parameters:
-                    for item in parameters[p]:
-                        if item['index'] == el['index']:
-                            v = item['value']
-                new_row = pd.DataFrame({'Index': [el['index']], 'Value': v}, index=[0])
-                row_list.append(new_row)
-            if len(row_list) > 0:
-                par[p] = pd.concat(row_list, ignore_index=True)
-            else:
-                par[p] = pd.DataFrame({'Index': [], 'Value': []})
+            # update defaults with existing values by hashed index, the last definition of an index wins
+            table = mu.ParameterTable.from_index_value(element_list)
+            if p in parameters:
+                table.update(get_parameter_table(parameters[p]))
+            par[p] = table.to_frame()
         else:
             par[p] = pd.DataFrame([parameters[p]], columns=['Value'])
     if index_value:
@@ -149,6 +302,18 @@ def build_parameters(sets, parameters, spec, index_value=False, indexed_sets=dic
     return par
 
 
+def get_parameter_table(parameter):
+    """
+    Get a ParameterTable from a parameter in index-value form or a ParameterTable.
+
+    :param parameter: list of index value dicts or ParameterTable
+    :return: ParameterTable
+    """
+    if isinstance(parameter, mu.ParameterTable):
+        return parameter
+    return mu.ParameterTable.from_index_value(parameter)
+
+
 def build_indexed_sets(sets, indexed_sets, spec):
     """
     Build a dictionary of DataFrames of default parameters from sets using existing indexed set members.
@@ -162,30 +327,37 @@ def build_indexed_sets(sets, indexed_sets, spec):
     ind_sets = {}
     for default_set, default_dict in spec.get_default_indexed_sets(sets).items():
         if 'within' in spec.user_defined_indexed_sets[default_set]:
-            within = spec.user_defined_indexed_sets[default_set]['within'][0]
+            within = set(sets[spec.user_defined_indexed_sets[default_set]['within'][0]])
         else:
             within = None
-        row_list = []
         print(default_set + ': ' + spec.user_defined_indexed_sets[default_set]['doc'])
-        for ind, members in default_dict.items():
-            m = members
+        members = []
+        existing = indexed_sets[default_set] if default_set in indexed_sets else {}
+        for ind, m in default_dict.items():
             # update members if indexed set was already defined as long as it respects domain
-            if default_set in indexed_sets:
-                for k, v in indexed_sets[default_set].items():
-                    if k == ind:
-                        m = set(v)
-                        if within:
-                            m = list(set(sets[within]).intersection(m))
-            new_row = pd.DataFrame({'Index': [ind], 'Members': [m]}, index=[0])
-            row_list.append(new_row)
-        if len(row_list) > 0:
-            ind_sets[default_set] = pd.concat(row_list, ignore_index=True)
-        else:
-            ind_sets[default_set] = pd.DataFrame({'Index': [], 'Members': []})
+            if ind in existing:
+                m = set(existing[ind])
+                if within is not None:
+                    m = list(within.intersection(m))
+            members.append(m)
+        ind_sets[default_set] = pd.DataFrame({'Index': list(default_dict), 'Members': members})
 
     return ind_sets
 
 
+@lru_cache(maxsize=None)
+def get_transport_unit_conversion(material_unit, transport_unit):
+    """
+    Get the factor that converts a material flow unit moved over a km into a transport flow unit. Each
+    distinct pair of openLCA units is only converted once.
+
+    :param str material_unit: openLCA unit of material flow
+    :param str transport_unit: openLCA unit of transport flow
+    :return: float
+    """
+    return pu.convert_value(1, from_units=map_units(material_unit) * pu.km, to_units=map_units(transport_unit))
+
+
 def map_units(unit=None):
     """
     A dictionary that maps openLCA database units for product flows to pyomo units.
@@ -12,6 +12,14 @@ import os
 import gc
 import time
 import platform
+import threading
+import queue
+import csv
+import hashlib
+import glob
+from itertools import islice, chain
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 
 def get_default_db_file():
@@ -60,6 +68,37 @@ LCA_table = [
 ]
 
 
+def get_export_call(tbl, csv_path, separate_lob=False):
+    """
+    Build the Derby system procedure call that exports a table to a headerless CSV file.
+
+    :param str tbl: table name
+    :param str csv_path: full path to folder for CSV files
+    :param bool separate_lob: export large objects to a separate .lob file
+    :return: SQL string
+    """
+    if separate_lob:
+        call_str = "CALL SYSCS_UTIL.SYSCS_EXPORT_TABLE_LOBS_TO_EXTFILE (%s,%s,%s,%s,%s,%s,%s)" % \
+                   (
+                       'null',
+                       "'" + tbl + "'",
+                       "'" + csv_path + "/" + tbl + ".csv'",
+                       'null',
+                       'null',
+                       "'UTF-8'",
+                       "'" + csv_path + "/" + tbl + ".lob'")
+    else:
+        call_str = "CALL SYSCS_UTIL.SYSCS_EXPORT_TABLE (%s,%s,%s,%s,%s,%s)" % \
+                   (
+                       'null',
+                       "'" + tbl + "'",
+                       "'" + csv_path + "/" + tbl + ".csv'",
+                       'null',
+                       'null',
+                       "'UTF-8'")
+    return call_str
+
+
 def derby_to_csv(db_conn, db_folder, separate_lob=False):
     """
     Uses the SYSCS_UTIL.SYSCS_EXPORT_TABLE method to export to headerless CSV files.
@@ -78,30 +117,62 @@ def derby_to_csv(db_conn, db_folder, separate_lob=False):
 
     for tbl in table_name:
         print("Exporting", tbl, "to csv")
-        if separate_lob:
-            call_str = "CALL SYSCS_UTIL.SYSCS_EXPORT_TABLE_LOBS_TO_EXTFILE (%s,%s,%s,%s,%s,%s,%s)" % \
-                       (
-                           'null',
-                           "'" + tbl + "'",
-                           "'" + csv_path + "/" + tbl + ".csv'",
-                           'null',
-                           'null',
-                           "'UTF-8'",
-                           "'" + csv_path + "/" + tbl + ".lob'")
-        else:
-            call_str = "CALL SYSCS_UTIL.SYSCS_EXPORT_TABLE (%s,%s,%s,%s,%s,%s)" % \
-                       (
-                           'null',
-                           "'" + tbl + "'",
-                           "'" + csv_path + "/" + tbl + ".csv'",
-                           'null',
-                           'null',
-                           "'UTF-8'")
+        call_str = get_export_call(tbl, csv_path, separate_lob)
         print(call_str)
         curs.execute(call_str)
     return Path(csv_path)
 
 
+def derby_to_csv_parallel(db_dir_name, derby_jar, db_folder, separate_lob=False, workers=4):
+    """
+    Export Derby tables to headerless CSV files using a pool of worker threads, each with its own JDBC
+    connection. Tables are scheduled largest first so that TBL_EXCHANGES does not finish last on its own.
+
+    :param db_dir_name: full path to Derby folder
+    :param derby_jar: full path of Derby driver jar
+    :param db_folder: full path to Derby database folder used to name the CSV folder
+    :param bool separate_lob: export large objects to separate .lob files
+    :param int workers: number of concurrent JDBC connections
+    :return: tuple of path to folder containing CSV files and dict of export seconds keyed by table name
+    """
+
+    csv_path = str(db_folder) + '_' + str(time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(csv_path)
+
+    # order the tables by size on disk, largest first
+    conn = get_jdbc_connection(db_dir_name, derby_jar)
+    table_size = get_derby_table_sizes(conn)
+    table_name = sorted(get_derby_tables(conn), key=lambda t: table_size.get(t, 0), reverse=True)
+    conn.close()
+
+    # each worker thread opens one connection and keeps it for the lifetime of the pool
+    local = threading.local()
+    connections = []
+
+    def export_table(tbl):
+        if not hasattr(local, 'conn'):
+            local.conn = get_jdbc_connection(db_dir_name, derby_jar)
+            connections.append(local.conn)
+        start = time.perf_counter()
+        curs = local.conn.cursor()
+        curs.execute(get_export_call(tbl, csv_path, separate_lob))
+        curs.close()
+        return time.perf_counter() - start
+
+    timing = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        future_table = {executor.submit(export_table, tbl): tbl for tbl in table_name}
+        for future in as_completed(future_table):
+            tbl = future_table[future]
+            timing[tbl] = future.result()
+            print("Exported", tbl, "to csv in", "{0:.1f}s".format(timing[tbl]))
+
+    for c in connections:
+        c.close()
+
+    return Path(csv_path), timing
+
+
 def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=1000000):
     """
     Get openLCA CSV data in a folder and convert to a sqlite database.
@@ -141,6 +212,345 @@ def csv_to_sqlite(csv_folder, db_file, table_cols, method=None, chunk_size=10000
     return db_file
 
 
+def set_loader_pragmas(sqlite_conn, cache_size=1000000, journal=False):
+    """
+    Set up a sqlite connection that is used to bulk load a database. Without the journal, journaling and syncing
+    are switched off, so a crash during the load leaves a corrupt file and the database has to be rebuilt from
+    scratch. Only one-shot loads should do this.
+
+    :param sqlite3.Connection sqlite_conn: database connection
+    :param int cache_size: page cache size in KiB
+    :param bool journal: keep the rollback journal, for resumable loads and updates of an existing database
+    :return: None
+    """
+    c = sqlite_conn.cursor()
+    if not journal:
+        c.execute("PRAGMA journal_mode = OFF")
+        c.execute("PRAGMA synchronous = OFF")
+    c.execute("PRAGMA locking_mode = EXCLUSIVE")
+    c.execute("PRAGMA temp_store = MEMORY")
+    c.execute("PRAGMA cache_size = -%d" % cache_size)
+    c.close()
+
+
+def get_checkpoints(sqlite_conn):
+    """
+    Get the import progress recorded in the checkpoint table of a sqlite database.
+
+    :param sqlite3.Connection sqlite_conn: database connection
+    :return: dict of (chunks written, rows written, complete) keyed by table name
+    """
+    c = sqlite_conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS MOLA_CHECKPOINT (TABLE_NAME TEXT PRIMARY KEY, CHUNK INTEGER, "
+              "ROW_COUNT INTEGER, COMPLETE INTEGER)")
+    c.execute("SELECT TABLE_NAME, CHUNK, ROW_COUNT, COMPLETE FROM MOLA_CHECKPOINT")
+    checkpoints = {r[0]: tuple(r[1:]) for r in c.fetchall()}
+    c.close()
+    return checkpoints
+
+
+def set_checkpoint(cursor, tbl_name, chunk, row_count, complete=False):
+    """
+    Record the import progress of a table. Call inside the transaction that writes the chunk.
+
+    :param sqlite3.Cursor cursor: database cursor
+    :param str tbl_name: table name
+    :param int chunk: number of chunks written
+    :param int row_count: number of rows written
+    :param bool complete: all the rows of the table have been written
+    :return: None
+    """
+    cursor.execute("INSERT OR REPLACE INTO MOLA_CHECKPOINT VALUES (?, ?, ?, ?)",
+                   (tbl_name, chunk, row_count, int(complete)))
+
+
+def truncate_to_checkpoints(sqlite_conn, checkpoints):
+    """
+    Delete rows written after the last checkpoint of each table, which can be left behind by an interrupted
+    import. Tables are append only during an import so their rowids are the row numbers. Tables without a
+    checkpoint have not had a chunk committed yet, so all of their rows are deleted.
+
+    :param sqlite3.Connection sqlite_conn: database connection
+    :param dict checkpoints: dict from get_checkpoints
+    :return: None
+    """
+    c = sqlite_conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    for tbl_name in [r[0] for r in c.fetchall() if not r[0].startswith(('sqlite_', 'MOLA_'))]:
+        if tbl_name in checkpoints:
+            c.execute('DELETE FROM "%s" WHERE rowid > ?' % tbl_name, (checkpoints[tbl_name][1],))
+        else:
+            c.execute('DELETE FROM "%s"' % tbl_name)
+    c.close()
+
+
+def prepare_loader_db(db_file, resume=False):
+    """
+    Prepare a sqlite database for a bulk load. A one-shot load starts from a new database and does not record
+    checkpoints. A resumable load continues from the checkpoints in MOLA_CHECKPOINT after deleting the rows written
+    since. A database without a checkpoint table comes from a one-shot load, which runs without a journal, so it is
+    started again rather than resumed.
+
+    :param db_file: full path to sqlite db
+    :param bool resume: continue an interrupted import into db_file from its last checkpoint
+    :return: dict from get_checkpoints, empty for a one-shot load
+    """
+    db_file = str(db_file)
+    if os.path.exists(db_file):
+        try:
+            sqlite_conn = sqlite3.connect(db_file)
+            resumable = sqlite_conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND "
+                                            "name='MOLA_CHECKPOINT'").fetchone() is not None
+            sqlite_conn.close()
+        except sqlite3.DatabaseError:
+            resumable = False
+        if not resume or not resumable:
+            os.remove(db_file)
+    if not resume:
+        return {}
+
+    sqlite_conn = get_sqlite_connection(db_file)
+    checkpoints = get_checkpoints(sqlite_conn)
+    truncate_to_checkpoints(sqlite_conn, checkpoints)
+    sqlite_conn.commit()
+    sqlite_conn.close()
+    return checkpoints
+
+
+def get_csv_column_types(rows, col_names, col_types=None):
+    """
+    Get the sqlite column types of a table loaded from CSV rows, so that numbers are not stored as text. Columns
+    without a type in col_types are typed from their values in the rows, which are usually the first rows of the
+    file. A column without any values in the rows gets NUMERIC affinity, which stores numbers as numbers and
+    anything else as text.
+
+    :param list rows: list of rows of strings, with None for null values
+    :param list col_names: column names
+    :param dict col_types: dictionary of known sqlite types keyed by column name
+    :return: dictionary of sqlite types keyed by column name
+    """
+    if col_types is None:
+        col_types = {}
+
+    def get_value_type(value):
+        for value_type, fn in [('INTEGER', int), ('REAL', float)]:
+            try:
+                fn(value)
+                return value_type
+            except ValueError:
+                pass
+        return 'TEXT'
+
+    x = {}
+    for i, col in enumerate(col_names):
+        if col in col_types:
+            x[col] = col_types[col]
+            continue
+        value_types = {get_value_type(row[i]) for row in rows if i < len(row) and row[i] is not None}
+        if len(value_types) == 0:
+            x[col] = 'NUMERIC'
+        elif 'TEXT' in value_types:
+            x[col] = 'TEXT'
+        elif 'REAL' in value_types:
+            x[col] = 'REAL'
+        else:
+            x[col] = 'INTEGER'
+    return x
+
+
+def csv_to_sqlite_bulk(csv_folder, db_file, table_cols, table_types=None, chunk_size=1000000, cache_size=1000000,
+                       create_indices=True, resume=False, sample_size=1000):
+    """
+    Get openLCA CSV data in a folder and convert to a sqlite database without going through pandas.
+    Rows are streamed from the csv module into executemany with one transaction per chunk and indices
+    are only built once all the tables are loaded. A resumable load keeps the rollback journal and records its
+    progress in MOLA_CHECKPOINT after each chunk, while a one-shot load runs without a journal.
+
+    :param csv_folder: folder containing CSV files for each table
+    :param db_file: full path to sqlite db
+    :param dict table_cols: dictionary of table column names
+    :param dict table_types: dictionary of column sqlite types keyed by table name and then column name, the
+                             types of other columns are inferred with get_csv_column_types
+    :param int chunk_size: number of rows in each transaction
+    :param int cache_size: sqlite page cache size in KiB used during the load
+    :param bool create_indices: build the indices in create_csv_indices after loading
+    :param bool resume: make the import resumable and continue an interrupted import into db_file from its last
+                        checkpoint
+    :param int sample_size: number of rows used to infer the column types
+    :return: Path of sqlite db
+    """
+
+    # get all the CSVs in folder
+    csv_name = [f for f in os.listdir(str(csv_folder)) if f.endswith('.csv')]
+
+    # connect to sqlite database and manage transactions explicitly
+    checkpoints = prepare_loader_db(db_file, resume)
+    sqlite_conn = get_sqlite_connection(str(db_file))
+    sqlite_conn.isolation_level = None
+    set_loader_pragmas(sqlite_conn, cache_size, journal=resume)
+    c = sqlite_conn.cursor()
+
+    # Derby exports clobs inline unless they are separated
+    csv.field_size_limit(2 ** 31 - 1)
+
+    # write each CSV file to sqlite db
+    for tbl in csv_name:
+
+        csv_file = str(csv_folder) + '/' + tbl
+        tbl_name = os.path.splitext(tbl)[0]
+        chunk_num, row_num, complete = checkpoints.get(tbl_name, (0, 0, False))
+        if complete:
+            print("Skipping imported file", tbl)
+        elif os.path.getsize(csv_file) > 0:
+            print("Importing file", tbl)
+            insert_stmt = 'INSERT INTO "%s" VALUES (%s)' % (tbl_name, ','.join('?' * len(table_cols[tbl_name])))
+
+            with open(csv_file, newline='', encoding='utf-8') as fp:
+                # Derby writes nulls as empty fields and rows before the checkpoint are skipped
+                rows = ([None if v == '' else v for v in row] for row in islice(csv.reader(fp), row_num, None))
+
+                # type the columns from the first rows
+                sample = list(islice(rows, sample_size))
+                rows = chain(sample, rows)
+                col_types = get_csv_column_types(sample, table_cols[tbl_name],
+                                                 table_types.get(tbl_name) if table_types else None)
+                col_def = ', '.join('"%s" %s' % (col, col_types[col]) for col in table_cols[tbl_name])
+                c.execute('CREATE TABLE IF NOT EXISTS "%s" (%s)' % (tbl_name, col_def))
+
+                while True:
+                    c.execute("BEGIN")
+                    c.executemany(insert_stmt, islice(rows, chunk_size))
+                    row_count = max(c.rowcount, 0)
+                    row_num += row_count
+                    if row_count > 0:
+                        chunk_num += 1
+                    if resume:
+                        set_checkpoint(c, tbl_name, chunk_num, row_num, complete=row_count == 0)
+                    c.execute("COMMIT")
+                    if row_count == 0:
+                        break
+                    print('Exported chunk', chunk_num - 1)
+
+    c.close()
+    sqlite_conn.close()
+
+    if create_indices:
+        create_csv_indices(db_file)
+
+    return db_file
+
+
+def get_manifest(sqlite_conn, tbl_name):
+    """
+    Get the chunk fingerprints of a table from the manifest in a sqlite database created by
+    csv_to_sqlite_incremental.
+
+    :param sqlite3.Connection sqlite_conn: database connection
+    :param str tbl_name: table name
+    :return: dict of (chunk size, row count, hash) keyed by chunk number
+    """
+    c = sqlite_conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS MOLA_MANIFEST (TABLE_NAME TEXT, CHUNK INTEGER, CHUNK_SIZE INTEGER, "
+              "ROW_COUNT INTEGER, HASH TEXT, PRIMARY KEY (TABLE_NAME, CHUNK))")
+    c.execute("SELECT CHUNK, CHUNK_SIZE, ROW_COUNT, HASH FROM MOLA_MANIFEST WHERE TABLE_NAME = ?", (tbl_name,))
+    manifest = {r[0]: tuple(r[1:]) for r in c.fetchall()}
+    c.close()
+    return manifest
+
+
+def csv_to_sqlite_incremental(csv_folder, db_file, table_cols, table_types=None, chunk_size=1000000,
+                              cache_size=1000000, create_indices=True, sample_size=1000):
+    """
+    Update a sqlite database from openLCA CSV data in a folder, only reloading the chunks of rows that changed
+    since the previous import. Each chunk is fingerprinted by its row count and a hash of its content and
+    compared with the manifest table MOLA_MANIFEST. Chunk n of a table is stored with rowids from
+    n * chunk_size + 1 so that it can be replaced on its own.
+
+    :param csv_folder: folder containing CSV files for each table
+    :param db_file: full path to sqlite db, created if it does not exist
+    :param dict table_cols: dictionary of table column names
+    :param dict table_types: dictionary of column sqlite types keyed by table name and then column name, the
+                             types of other columns are inferred with get_csv_column_types
+    :param int chunk_size: number of rows in each chunk
+    :param int cache_size: sqlite page cache size in KiB used during the load
+    :param bool create_indices: build the indices in create_csv_indices after loading
+    :param int sample_size: number of rows used to infer the column types of a new table
+    :return: tuple of sqlite db and dictionary of lists of reloaded chunk numbers keyed by table name
+    """
+
+    # get all the CSVs in folder
+    csv_name = [f for f in os.listdir(str(csv_folder)) if f.endswith('.csv')]
+
+    # keep the journal because the existing database is being updated
+    sqlite_conn = get_sqlite_connection(str(db_file))
+    sqlite_conn.isolation_level = None
+    set_loader_pragmas(sqlite_conn, cache_size, journal=True)
+    c = sqlite_conn.cursor()
+    csv.field_size_limit(2 ** 31 - 1)
+
+    reloaded = {}
+    for tbl in csv_name:
+
+        csv_file = str(csv_folder) + '/' + tbl
+        tbl_name = os.path.splitext(tbl)[0]
+        manifest = get_manifest(sqlite_conn, tbl_name)
+        existing_cols = [r[1] for r in c.execute('PRAGMA table_info("%s")' % tbl_name).fetchall()]
+        if os.path.getsize(csv_file) == 0 and len(existing_cols) == 0:
+            continue
+
+        # start again if the columns or the chunk size have changed, typing the columns from the first rows
+        if existing_cols != table_cols[tbl_name] or any(m[0] != chunk_size for m in manifest.values()):
+            c.execute('DROP TABLE IF EXISTS "%s"' % tbl_name)
+            c.execute("DELETE FROM MOLA_MANIFEST WHERE TABLE_NAME = ?", (tbl_name,))
+            with open(csv_file, newline='', encoding='utf-8') as fp:
+                sample = [[None if v == '' else v for v in row] for row in islice(csv.reader(fp), sample_size)]
+            col_types = get_csv_column_types(sample, table_cols[tbl_name],
+                                             table_types.get(tbl_name) if table_types else None)
+            col_def = ', '.join('"%s" %s' % (col, col_types[col]) for col in table_cols[tbl_name])
+            c.execute('CREATE TABLE "%s" (%s)' % (tbl_name, col_def))
+            manifest = {}
+
+        col_str = ','.join('"%s"' % col for col in table_cols[tbl_name])
+        insert_stmt = 'INSERT INTO "%s" (rowid, %s) VALUES (?,%s)' % \
+                      (tbl_name, col_str, ','.join('?' * len(table_cols[tbl_name])))
+
+        print("Checking file", tbl)
+        with open(csv_file, newline='', encoding='utf-8') as fp:
+            reader = csv.reader(fp)
+            chunk_num = 0
+            rows = list(islice(reader, chunk_size))
+            while len(rows) > 0:
+                chunk_hash = hashlib.sha1('\x1e'.join('\x1f'.join(row) for row in rows).encode('utf-8')).hexdigest()
+                if manifest.get(chunk_num) != (chunk_size, len(rows), chunk_hash):
+                    first_row = chunk_num * chunk_size
+                    c.execute("BEGIN")
+                    c.execute('DELETE FROM "%s" WHERE rowid > ? AND rowid <= ?' % tbl_name,
+                              (first_row, first_row + chunk_size))
+                    c.executemany(insert_stmt, ([first_row + i + 1] + [None if v == '' else v for v in row]
+                                                for i, row in enumerate(rows)))
+                    c.execute("INSERT OR REPLACE INTO MOLA_MANIFEST VALUES (?, ?, ?, ?, ?)",
+                              (tbl_name, chunk_num, chunk_size, len(rows), chunk_hash))
+                    c.execute("COMMIT")
+                    reloaded.setdefault(tbl_name, []).append(chunk_num)
+                    print('Reloaded chunk', chunk_num)
+                chunk_num += 1
+                rows = list(islice(reader, chunk_size))
+
+        # remove rows beyond the end of the new table
+        c.execute("BEGIN")
+        c.execute('DELETE FROM "%s" WHERE rowid > ?' % tbl_name, (chunk_num * chunk_size,))
+        c.execute("DELETE FROM MOLA_MANIFEST WHERE TABLE_NAME = ? AND CHUNK >= ?", (tbl_name, chunk_num))
+        c.execute("COMMIT")
+
+    c.close()
+    sqlite_conn.close()
+
+    if create_indices:
+        create_csv_indices(db_file)
+
+    return db_file, reloaded
+
+
 def derby_to_sqlite(db, derby_input_folder, csv_output_folder, sqlite_output_folder,
                     derby_driver_path='C:/share/db-derby-10.15.1.3-bin/lib/derby.jar', version=None):
     """
@@ -239,6 +649,54 @@ def get_derby_table_column_names(db_conn, table_name):
     return x
 
 
+def get_derby_table_column_types(db_conn, table_name):
+    """
+    Get a dictionary of sqlite column types that match the Derby column types.
+
+    :param db_conn: JDBC database connection
+    :param table_name: list of table names
+    :return: dictionary of dictionaries of sqlite types keyed by table name and then column name
+    """
+
+    # construct query string
+    tbl_str = ','.join("'{0}'".format(t) for t in table_name if len(t) > 0)
+    curs = db_conn.cursor()
+    ex_str = """
+    select t.TABLENAME, c.COLUMNNAME, CAST(c.COLUMNDATATYPE AS VARCHAR(128))
+    FROM sys.systables t, sys.syscolumns c
+    WHERE t.TABLEID = c.REFERENCEID and t.tablename IN (%s)
+    ORDER BY t.TABLENAME, c.COLUMNNUMBER
+    """ % tbl_str
+
+    curs.execute(ex_str)
+    x = {}
+    for tbl, col, derby_type in curs.fetchall():
+        x.setdefault(tbl, {})[col] = get_sqlite_type(derby_type)
+    curs.close()
+
+    return x
+
+
+def get_sqlite_type(derby_type):
+    """
+    Map a Derby column type to a sqlite type affinity.
+
+    :param str derby_type: Derby type e.g. VARCHAR(255) NOT NULL
+    :return: sqlite type
+    """
+    base_type = derby_type.split('(')[0].replace(' NOT NULL', '').strip().upper()
+    if 'FOR BIT DATA' in derby_type.upper():
+        return 'BLOB'
+    elif base_type in ('BIGINT', 'INTEGER', 'SMALLINT', 'BOOLEAN'):
+        return 'INTEGER'
+    elif base_type in ('DOUBLE', 'DOUBLE PRECISION', 'REAL', 'FLOAT', 'DECIMAL', 'NUMERIC'):
+        return 'REAL'
+    elif base_type == 'BLOB':
+        return 'BLOB'
+    else:
+        return 'TEXT'
+
+
 def get_derby_tables(db_conn):
     """
     Get table names from a Derby database.
@@ -258,6 +716,27 @@ def get_derby_tables(db_conn):
     return tbl
 
 
+def get_derby_table_sizes(db_conn):
+    """
+    Get the space allocated to each table in a Derby database, excluding indices.
+
+    :param db_conn: Derby database connection
+    :return: dictionary of bytes keyed by table name
+    """
+    curs = db_conn.cursor()
+    ex_str = """
+    SELECT t.TABLENAME, SUM(s.NUMALLOCATEDPAGES * s.PAGESIZE)
+    FROM SYS.SYSTABLES t, SYS.SYSSCHEMAS sc,
+    TABLE (SYSCS_DIAG.SPACE_TABLE(sc.SCHEMANAME, t.TABLENAME)) s
+    WHERE t.TABLETYPE='T' AND sc.SCHEMAID = t.SCHEMAID AND s.ISINDEX = 0
+    GROUP BY t.TABLENAME
+    """
+    curs.execute(ex_str)
+    size = {t[0]: int(t[1]) for t in curs.fetchall() if t[0].startswith('TBL_')}
+    curs.close()
+    return size
+
+
 def get_derby(db_conn, table_name=None, chunk_size=10000):
     """
     Get openLCA data from an uncompressed Derby directory. Can only load a description with small tables because
@@ -350,6 +829,163 @@ def derby_to_sqlite(db_conn, db_file, table_name=LCA_table, select_cols=LCA_cols
     return db_file
 
 
+def to_sqlite_value(x):
+    """ convert JDBC values that sqlite cannot bind to strings """
+    if x is None or isinstance(x, (int, float, str, bytes)):
+        return x
+    elif hasattr(x, 'getSubString'):
+        return clob_to_string(x)
+    else:
+        return str(x)
+
+
+def derby_to_sqlite_stream(db_conn, db_file, table_name=None, table_types=None, select_cols=None,
+                           batch_size=10000, queue_size=16, cache_size=1000000, schema='APP', resume=False,
+                           key='ID'):
+    """
+    Stream openLCA data from a Derby database into a sqlite database without an intermediate CSV folder.
+
+    Batches from the JDBC cursor are put on a bounded queue and inserted by a writer thread that owns the
+    sqlite connection, so reading from Derby and writing to sqlite overlap and the queue bounds the memory in use.
+    A resumable load keeps the rollback journal and commits each batch with its checkpoint in MOLA_CHECKPOINT,
+    while a one-shot load runs without a journal. Rows of tables with the key column are read in key order so that
+    on resume the Derby rows already written are skipped with WHERE key > the last key in the sqlite table. Tables
+    without it, such as the link tables, are read unordered and restarted from scratch on resume.
+
+    :param db_conn: JDBC database connection
+    :param db_file: full path to sqlite db
+    :param list table_name: list of table names, all openLCA tables if None
+    :param dict table_types: dictionary of column sqlite types keyed by table name and then column name
+    :param dict select_cols: dictionary of column selections keyed by table name, all columns if not present
+    :param int batch_size: number of rows fetched from Derby in each batch
+    :param int queue_size: maximum number of batches waiting to be written
+    :param int cache_size: sqlite page cache size in KiB used during the load
+    :param str schema: Derby schema name
+    :param bool resume: make the import resumable and continue an interrupted import into db_file from its last
+                        checkpoint
+    :param str key: unique column the rows of a table are ordered by if the table selects it under this name
+    :return: file path of sqlite db
+    """
+
+    # get all the tables if None specified
+    if table_name is None:
+        table_name = get_derby_tables(db_conn)
+    if table_types is None:
+        table_types = {}
+    if select_cols is None:
+        select_cols = {}
+
+    # get the progress of a previous import
+    checkpoints = prepare_loader_db(db_file, resume)
+    last_key = {}
+    sqlite_conn = get_sqlite_connection(str(db_file))
+    for tbl, (chunk_num, row_num, complete) in checkpoints.items():
+        if row_num > 0 and not complete and \
+                key in [r[1] for r in sqlite_conn.execute('PRAGMA table_info("%s")' % tbl)]:
+            last_key[tbl] = sqlite_conn.execute('SELECT MAX("%s") FROM "%s"' % (key, tbl)).fetchone()[0]
+    sqlite_conn.close()
+
+    # the writer thread executes lists of (sql, rows) statements until it receives None
+    batch_queue = queue.Queue(maxsize=queue_size)
+    writer_error = []
+
+    def write_batches():
+        sqlite_conn = get_sqlite_connection(str(db_file))
+        sqlite_conn.isolation_level = None
+        set_loader_pragmas(sqlite_conn, cache_size, journal=resume)
+        c = sqlite_conn.cursor()
+        try:
+            item = batch_queue.get()
+            while item is not None:
+                for sql, rows in item:
+                    if rows is None:
+                        c.execute(sql)
+                    else:
+                        c.executemany(sql, rows)
+                item = batch_queue.get()
+        except Exception as e:
+            writer_error.append(e)
+        finally:
+            c.close()
+            sqlite_conn.close()
+
+    writer = threading.Thread(target=write_batches, daemon=True)
+    writer.start()
+
+    def put(item):
+        while writer.is_alive():
+            try:
+                batch_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        raise writer_error[0] if writer_error else RuntimeError('sqlite writer thread stopped')
+
+    checkpoint_stmt = "INSERT OR REPLACE INTO MOLA_CHECKPOINT VALUES (?, ?, ?, ?)"
+    curs = db_conn.cursor()
+    try:
+        for tbl in table_name:
+
+            chunk_num, row_num, complete = checkpoints.get(tbl, (0, 0, False))
+            if complete:
+                print("Skipping imported table", tbl)
+                continue
+
+            print("Importing table", tbl)
+            select_str = 'SELECT ' + select_cols.get(tbl, '*') + ' FROM ' + schema + '.' + tbl
+
+            # get the columns without reading any rows to check for the key column
+            curs.execute(select_str + ' WHERE 1 = 0')
+            col_names = [d[0] for d in curs.description]
+            if key in col_names and tbl in last_key:
+                curs.execute(select_str + ' WHERE ' + key + ' > ? ORDER BY ' + key, [last_key[tbl]])
+            elif key in col_names:
+                curs.execute(select_str + ' ORDER BY ' + key)
+            else:
+                curs.execute(select_str)
+
+            # create the sqlite table from the cursor columns
+            col_types = table_types.get(tbl, {})
+            col_def = ', '.join(('"%s" %s' % (col, col_types.get(col, ''))).strip() for col in col_names)
+            put([('CREATE TABLE IF NOT EXISTS "%s" (%s)' % (tbl, col_def), None)])
+
+            # a partly imported table without a key to resume from is imported again
+            if row_num > 0 and tbl not in last_key:
+                put([('DELETE FROM "%s"' % tbl, None)])
+                chunk_num, row_num = 0, 0
+            insert_stmt = 'INSERT INTO "%s" VALUES (%s)' % (tbl, ','.join('?' * len(col_names)))
+
+            # one transaction per batch together with its checkpoint
+            batch = curs.fetchmany(batch_size)
+            while len(batch) > 0:
+                chunk_num += 1
+                row_num += len(batch)
+                item = [('BEGIN', None), (insert_stmt, [tuple(to_sqlite_value(x) for x in row) for row in batch])]
+                if resume:
+                    item.append((checkpoint_stmt, [(tbl, chunk_num, row_num, 0)]))
+                put(item + [('COMMIT', None)])
+                print('Exported chunk', chunk_num - 1)
+                batch = curs.fetchmany(batch_size)
+            if resume:
+                put([(checkpoint_stmt, [(tbl, chunk_num, row_num, 1)])])
+    finally:
+        curs.close()
+
+        # stop the writer thread, also when reading from Derby fails
+        while writer.is_alive():
+            try:
+                batch_queue.put(None, timeout=1)
+                break
+            except queue.Full:
+                pass
+        writer.join()
+
+    if writer_error:
+        raise writer_error[0]
+
+    return db_file
+
+
 def get_json_zip(zip_filename):
     """ Get json files in a JSON-LD zip file
     :param zip_filename:
@@ -371,6 +1007,59 @@ def get_json_zip(zip_filename):
     return json_dict
 
 
+def get_json_file_list(name_list, limit=None):
+    """ Get the JSON files in a JSON-LD zip file name list split into directory and file name
+    :param name_list: list of zip member names
+    :param limit: limit the number of processes
+    :return: list of [directory, file name]
+    """
+    json_file_list = []
+    for name in name_list:
+        tf = name.split("/")
+        if len(tf) > 1 and len(tf[1]) > 0:
+            json_file_list.append(tf)
+
+    # limit processes if flag set
+    if limit is not None:
+        new_file_list = []
+        p_count = 0
+        for f in json_file_list:
+            if f[0] == "processes" and p_count < limit:
+                new_file_list.append(f)
+                p_count += 1
+            elif f[0] != "processes":
+                new_file_list.append(f)
+
+        json_file_list = new_file_list
+
+    return json_file_list
+
+
+def get_json_db_file(db_file_base, resume=False, file_key=None):
+    """ Get a time-stamped sqlite file name for a JSON-LD import
+    :param db_file_base: full path to sqlite db without time stamp
+    :param resume: return the latest existing time-stamped file if there is one and its import of file_key has not
+                   completed
+    :param file_key: checkpoint name of the import
+    :return: full path to sqlite db
+    """
+    if resume:
+        db_files = sorted(glob.glob(glob.escape(db_file_base) + '_*.sqlite'))
+        if len(db_files) > 0:
+            try:
+                conn = sqlite3.connect(db_files[-1])
+                try:
+                    row = conn.execute("SELECT COMPLETE FROM MOLA_CHECKPOINT WHERE TABLE_NAME = ?",
+                                       (file_key,)).fetchone()
+                finally:
+                    conn.close()
+            except sqlite3.DatabaseError:
+                row = None
+            if row is None or not row[0]:
+                return db_files[-1]
+    return db_file_base + '_' + str(time.strftime("%Y%m%d-%H%M%S")) + '.sqlite'
+
+
 def json_to_custom(zip_filename, db_file_base, limit=None):
     """ Get json files in a JSON-LD zip file and store customised information in a sqlite database.
     :param zip_filename:
@@ -391,24 +1080,7 @@ def json_to_custom(zip_filename, db_file_base, limit=None):
     conn = get_sqlite_connection(db_file)
 
     # find just the JSON files
-    json_file_list = []
-    for name in name_list:
-        tf = name.split("/")
-        if len(tf) > 1 and len(tf[1]) > 0:
-            json_file_list.append(tf)
-
-    # limit processes if flag set
-    if limit is not None:
-        new_file_list = []
-        p_count = 0
-        for f in json_file_list:
-            if f[0] == "processes" and p_count < limit:
-                new_file_list.append(f)
-                p_count += 1
-            elif f[0] != "processes":
-                new_file_list.append(f)
-
-        json_file_list = new_file_list
+    json_file_list = get_json_file_list(name_list, limit)
 
     print("Populating tables ...")
     file_num = 1
@@ -433,11 +1105,15 @@ def json_to_custom(zip_filename, db_file_base, limit=None):
     return db_file
 
 
-def json_to_sqlite(zip_filename, db_file_base, limit=None):
+def json_to_sqlite(zip_filename, db_file_base, limit=None, resume=False, chunk_size=10000):
     """ Get json files in a JSON-LD zip file and store them in a sqlite database.
+    A resumable load commits its progress to MOLA_CHECKPOINT every chunk_size files.
     :param zip_filename:
     :param db_file_base:
     :param limit: limit the number of processes to export
+    :param resume: make the import resumable and continue the latest interrupted import for db_file_base from its
+                   last checkpoint, a completed import is not continued and the import starts in a new file
+    :param chunk_size: number of files written in each transaction
     :return: file path of time-stamped sqlite db
     """
 
@@ -449,15 +1125,13 @@ def json_to_sqlite(zip_filename, db_file_base, limit=None):
     # connect to sqlite database
     if os.path.exists(db_file_base):
         os.remove(db_file_base)
-    db_file = db_file_base + '_' + str(time.strftime("%Y%m%d-%H%M%S")) + '.sqlite'
+    file_key = os.path.basename(zip_filename)
+    db_file = get_json_db_file(db_file_base, resume, file_key)
+    checkpoints = prepare_loader_db(db_file, resume)
     conn = get_sqlite_connection(db_file)
 
     # find just the JSON files
-    json_file_list = []
-    for name in name_list:
-        tf = name.split("/")
-        if len(tf) > 1 and len(tf[1]) > 0:
-            json_file_list.append(tf)
+    json_file_list = get_json_file_list(name_list)
 
     # create the tables from unique directory names
     c = conn.cursor()
@@ -474,32 +1148,36 @@ def json_to_sqlite(zip_filename, db_file_base, limit=None):
     conn.commit()
 
     # limit processes if flag set
-    if limit is not None:
-        new_file_list = []
-        p_count = 0
-        for f in json_file_list:
-            if f[0] == "processes" and p_count < limit:
-                new_file_list.append(f)
-                p_count += 1
-            elif f[0] != "processes":
-                new_file_list.append(f)
+    json_file_list = get_json_file_list(name_list, limit)
 
-        json_file_list = new_file_list
+    # skip files written before the last checkpoint
+    chunk_num, file_start, complete = checkpoints.get(file_key, (0, 0, False))
+    row_count = {tbl: checkpoints.get(tbl, (0, 0, False))[1] for tbl in tbl_list | {'process_grid'}}
 
     # write each json file to db
     print("Populating tables ...")
-    file_num = 1
-    for f in json_file_list:
+    file_num = file_start + 1
+    for f in json_file_list[file_start:]:
         j = json.loads(zip_file.read('/'.join(f)))
 
         # insert exchanges into dedicated table
         if f[0] == "processes":
             sql_stmt = "insert into process_grid values (?, ?, ?)"
             c.execute(sql_stmt, [json.dumps(j), 0, 0])
+            row_count['process_grid'] += 1
 
         # insert json chunk into table
         sql_stmt = "insert into %s values (?)" % f[0]
         c.execute(sql_stmt, [json.dumps(j)])
+        row_count[f[0]] += 1
+
+        # commit the files with their checkpoint
+        if resume and (file_num % chunk_size == 0 or file_num == len(json_file_list)):
+            chunk_num += 1
+            for tbl, n in row_count.items():
+                set_checkpoint(c, tbl, chunk_num, n)
+            set_checkpoint(c, file_key, chunk_num, file_num, complete=file_num == len(json_file_list))
+            conn.commit()
 
         work_done = file_num / len(json_file_list)
         print("\rProgress: [{0:50s}] {1:.1f}%".format('#' * int(work_done * 50), work_done * 100),
@@ -515,6 +1193,127 @@ def json_to_sqlite(zip_filename, db_file_base, limit=None):
     #     return (seq[pos:pos + size] for pos in range(0, len(seq), size))
 
 
+def read_json_members(zip_filename, names):
+    """ Read members of a JSON-LD zip file in a worker process for json_to_sqlite_parallel.
+    Only process files are decoded, to extract their exchanges; the other files are kept as JSON text.
+    :param zip_filename: JSON-LD zip file
+    :param names: list of member names
+    :return: tuple of list of (table name, JSON text) and list of (process id, flow id, input, amount)
+    """
+    json_rows = []
+    grid_rows = []
+    with zipfile.ZipFile(zip_filename, 'r') as zip_file:
+        for name in names:
+            raw = zip_file.read(name)
+            if len(raw) > 0:
+                tbl = name.split("/")[0]
+                text = raw.decode('utf-8')
+                json_rows.append((tbl, text))
+                if tbl == "processes":
+                    j = json.loads(text)
+                    grid_rows.extend((j['@id'], e.get('flow', {}).get('@id'), e.get('input'), e.get('amount'))
+                                     for e in j.get('exchanges', []))
+
+    return json_rows, grid_rows
+
+
+def json_to_sqlite_parallel(zip_filename, db_file_base, limit=None, workers=None, batch_size=5000, resume=False):
+    """ Get json files in a JSON-LD zip file and store them in a sqlite database using a pool of
+    worker processes to read and decode the files. The process exchanges are stored in process_exchanges, which
+    is not the process_grid table of json_to_sqlite.
+    At most two batches per worker are read ahead of the writer. A resumable load keeps the rollback journal and
+    commits each batch with its checkpoint in MOLA_CHECKPOINT, while a one-shot load runs without a journal.
+    :param zip_filename:
+    :param db_file_base:
+    :param limit: limit the number of processes to export
+    :param workers: number of worker processes, the number of CPUs if None
+    :param batch_size: number of files read by a worker and written in one transaction
+    :param resume: make the import resumable and continue the latest interrupted import for db_file_base from its
+                   last checkpoint, a completed import is not continued and the import starts in a new file
+    :return: file path of time-stamped sqlite db
+    """
+    start = time.perf_counter()
+
+    # get the file names in the zip
+    with zipfile.ZipFile(zip_filename, 'r') as zip_file:
+        name_list = zip_file.namelist()
+    print("Loading", len(name_list), "json files in", zip_filename)
+
+    # connect to sqlite database
+    if os.path.exists(db_file_base):
+        os.remove(db_file_base)
+    file_key = os.path.basename(zip_filename)
+    db_file = get_json_db_file(db_file_base, resume, file_key)
+    checkpoints = prepare_loader_db(db_file, resume)
+    conn = get_sqlite_connection(db_file)
+    conn.isolation_level = None
+    set_loader_pragmas(conn, journal=resume)
+    c = conn.cursor()
+
+    # find just the JSON files
+    json_file_list = get_json_file_list(name_list, limit)
+
+    # create the tables from unique directory names
+    tbl_list = set([j[0] for j in json_file_list])
+    for tbl in tbl_list:
+        print("Creating table", tbl)
+        c.execute("CREATE TABLE IF NOT EXISTS %s (data json)" % tbl)
+    c.execute("CREATE TABLE IF NOT EXISTS process_exchanges (id text, flowid text, input integer, amount real)")
+
+    # skip files written before the last checkpoint
+    chunk_num, file_start, complete = checkpoints.get(file_key, (0, 0, False))
+    tbl_count = {tbl: checkpoints.get(tbl, (0, 0, False))[1] for tbl in tbl_list | {'process_exchanges'}}
+
+    # each worker reads a batch of files and each batch is written in one transaction
+    names = ['/'.join(f) for f in json_file_list]
+    batches = [names[i:i + batch_size] for i in range(file_start, len(names), batch_size)]
+    file_count = 0
+    row_count = 0
+    print("Populating tables ...")
+    window = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        # keep a bounded window of batches in flight and write them in order
+        batch_iter = iter(batches)
+        pending = deque(executor.submit(read_json_members, zip_filename, b) for b in islice(batch_iter, window))
+        while len(pending) > 0:
+            json_rows, grid_rows = pending.popleft().result()
+            for b in islice(batch_iter, 1):
+                pending.append(executor.submit(read_json_members, zip_filename, b))
+
+            c.execute("BEGIN")
+            tbl_rows = {}
+            for tbl, text in json_rows:
+                tbl_rows.setdefault(tbl, []).append((text,))
+            for tbl, rows in tbl_rows.items():
+                c.executemany("insert into %s values (?)" % tbl, rows)
+                tbl_count[tbl] += len(rows)
+            c.executemany("insert into process_exchanges values (?, ?, ?, ?)", grid_rows)
+            tbl_count['process_exchanges'] += len(grid_rows)
+
+            # record the checkpoint in the same transaction
+            chunk_num += 1
+            file_start += batch_size
+            if resume:
+                for tbl, n in tbl_count.items():
+                    set_checkpoint(c, tbl, chunk_num, n)
+                set_checkpoint(c, file_key, chunk_num, min(file_start, len(names)),
+                               complete=file_start >= len(names))
+            c.execute("COMMIT")
+
+            file_count += len(json_rows)
+            row_count += len(json_rows) + len(grid_rows)
+            print("Written", min(file_start, len(names)), "of", len(names), "files")
+
+    c.close()
+    conn.close()
+
+    elapsed = time.perf_counter() - start
+    print("Imported {0} files and {1} rows in {2:.1f}s ({3:.0f} files/s, {4:.0f} rows/s)".format(
+        file_count, row_count, elapsed, file_count / elapsed, row_count / elapsed))
+    return db_file
+
+
 def get_sqlite_connection(db_file=get_default_db_file()):
     """
     Get a database connection to the SQLite database.
@@ -531,6 +1330,25 @@ def get_sqlite_connection(db_file=get_default_db_file()):
     return conn
 
 
+def get_sqlite_read_connection(db_file=get_default_db_file(), mmap_size=2 ** 30):
+    """
+    Get a read-only connection to the SQLite database with memory-mapped I/O. Temporary tables
+    can still be created on the connection.
+
+    :param db_file: full path to database file
+    :param int mmap_size: maximum number of bytes of the database file to memory map
+    :return: Connection object or None
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(Path(db_file).resolve().as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+        conn.execute("PRAGMA mmap_size=%d" % mmap_size)
+    except sqlite3.Error as e:
+        print(e, db_file)
+
+    return conn
+
+
 def create_json_indices(db_file):
     conn = get_sqlite_connection(db_file)
     c = conn.cursor()
@@ -551,7 +1369,8 @@ def create_json_indices(db_file):
 
 def create_csv_indices(db_file):
     """
-    Create indices on tables in a sqlite database created from CSVs exported from Derby
+    Create indices on tables in a sqlite database created from CSVs exported from Derby, followed by
+    the covering indices from create_lca_indices
     :param db_file: database file
     :return: None
     """
@@ -567,36 +1386,193 @@ def create_csv_indices(db_file):
     CREATE INDEX IF NOT EXISTS TBL_FLOWS_ID ON TBL_FLOWS(ID)
     """
     c.execute(sql_stmt)
-    sql_stmt = """
-    CREATE INDEX IF NOT EXISTS TBL_EXCHANGES_F_FLOW ON TBL_EXCHANGES(F_FLOW)
+
+    conn.commit()
+    conn.close()
+
+    # covering indices and statistics for the library queries
+    create_lca_indices(db_file)
+
+
+# covering indices for the queries issued by mola.sqlgenerator and mola.dataview, one for each access path
+LCA_indices = {
+    'TBL_EXCHANGES': [
+        ['F_OWNER', 'F_FLOW', 'F_UNIT', 'RESULTING_AMOUNT_VALUE', 'COST_VALUE', 'F_CURRENCY'],
+        ['F_FLOW', 'F_OWNER', 'F_UNIT', 'RESULTING_AMOUNT_VALUE']
+    ],
+    'TBL_FLOWS': [
+        ['ID', 'REF_ID', 'FLOW_TYPE'],
+        ['FLOW_TYPE', 'ID', 'REF_ID']
+    ],
+    'TBL_PROCESSES': [
+        ['ID', 'REF_ID', 'F_LOCATION']
+    ],
+    'TBL_IMPACT_FACTORS': [
+        ['F_IMPACT_CATEGORY', 'F_FLOW', 'VALUE']
+    ]
+}
+
+
+def create_lca_indices(db_file, analyze=True):
     """
-    c.execute(sql_stmt)
-    sql_stmt = """
-    CREATE INDEX IF NOT EXISTS TBL_EXCHANGES_F_OWNER ON TBL_EXCHANGES(F_OWNER)
+    Create the indices in LCA_indices and an index on the ID and REF_ID of every entity table in a sqlite
+    openLCA database, then gather statistics for the query planner. Missing columns are left out of an index
+    and indices on missing tables or leading columns are skipped. An index that is a prefix of another index
+    on the same table is redundant, so it is not created and an existing one is dropped.
+    :param db_file: database file
+    :param bool analyze: run ANALYZE after the indices are built
+    :return: list of index names
     """
-    c.execute(sql_stmt)
+    print("Planning indices on", db_file)
+    conn = get_sqlite_connection(db_file)
+    c = conn.cursor()
 
+    # table columns
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+    table_cols = {}
+    for tbl_name in [row[0] for row in c.fetchall()]:
+        c.execute('PRAGMA table_info("%s")' % tbl_name)
+        table_cols[tbl_name] = [row[1] for row in c.fetchall()]
+
+    # REF_ID lookups return the ID and ID joins return the REF_ID
+    plan = {}
+    for tbl_name, cols in table_cols.items():
+        if 'REF_ID' in cols and 'ID' in cols:
+            plan[tbl_name] = [['REF_ID', 'ID'], ['ID', 'REF_ID']]
+        elif 'ID' in cols:
+            plan[tbl_name] = [['ID']]
+    for tbl_name, index_list in LCA_indices.items():
+        cols = table_cols.get(tbl_name, [])
+        plan[tbl_name] = plan.get(tbl_name, []) + [[col for col in index_cols if col in cols]
+                                                   for index_cols in index_list if index_cols[0] in cols]
+
+    def is_prefix(index_cols, other_cols):
+        return other_cols[:len(index_cols)] == index_cols
+
+    index_names = []
+    for tbl_name, index_list in plan.items():
+        index_list = [index_cols for i, index_cols in enumerate(index_list) if index_cols not in index_list[:i]]
+        for index_cols in index_list:
+            if any(is_prefix(index_cols, other_cols) for other_cols in index_list if other_cols != index_cols):
+                continue
+            index_name = '_'.join([tbl_name] + index_cols)
+            print("Creating index", index_name)
+            c.execute('CREATE INDEX IF NOT EXISTS "%s" ON "%s"(%s)' %
+                      (index_name, tbl_name, ', '.join('"%s"' % col for col in index_cols)))
+            index_names.append(index_name)
+
+        # drop existing non-unique indices made redundant by the planned ones
+        c.execute('PRAGMA index_list("%s")' % tbl_name)
+        for index_name in [r[1] for r in c.fetchall() if r[2] == 0 and r[3] == 'c' and r[1] not in index_names]:
+            c.execute('PRAGMA index_info("%s")' % index_name)
+            index_cols = [r[2] for r in c.fetchall()]
+            if any(is_prefix(index_cols, other_cols) for other_cols in index_list):
+                print("Dropping index", index_name)
+                c.execute('DROP INDEX "%s"' % index_name)
     conn.commit()
+
+    if analyze:
+        print("Analyzing", db_file)
+        c.execute("ANALYZE")
+        conn.commit()
+
+    conn.close()
+    return index_names
+
+
+def get_full_scans(conn, sql):
+    """
+    Get the tables that a query reads with a full scan from the sqlite query plan. Scans of
+    sub-query results are not included.
+    :param sqlite3.Connection conn: database connection
+    :param str sql: SQL string
+    :return: list of query plan details
+    """
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = {row[0].upper() for row in c.fetchall()}
+    c.execute("EXPLAIN QUERY PLAN " + sql)
+    full_scans = []
+    for row in c.fetchall():
+        detail = row[-1]
+        if detail.startswith('SCAN '):
+            name = detail.split()[2] if detail.split()[1] == 'TABLE' else detail.split()[1]
+            if name.strip('"').upper() in tables:
+                full_scans.append(detail)
+    c.close()
+    return full_scans
+
+
+def check_query_plans(db_file, process_ref_ids=None, impact_ref_ids=None):
+    """
+    Check the sqlgenerator queries use indices in a sqlite openLCA database.
+    :param db_file: database file
+    :param list[str] process_ref_ids: process reference ids used to build the queries
+    :param list[str] impact_ref_ids: impact category reference ids used to build the queries
+    :return: dictionary of full scans keyed by query name
+    """
+    import mola.sqlgenerator as sg
+    process_ref_ids = process_ref_ids if process_ref_ids else ['']
+    impact_ref_ids = impact_ref_ids if impact_ref_ids else ['']
+    queries = {
+        'build_process_elementary_flow': sg.build_process_elementary_flow(process_ref_ids),
+        'build_process_exchanges': sg.build_process_exchanges(process_ref_ids),
+        'build_impact_category_elementary_flow': sg.build_impact_category_elementary_flow(impact_ref_ids),
+        'build_location': sg.build_location(process_ref_ids),
+        'build_product_flow_units': sg.build_product_flow_units(process_ref_ids),
+        'build_product_flow_cost': sg.build_product_flow_cost(process_ref_ids, ['t0'])
+    }
+
+    conn = get_sqlite_connection(db_file)
+    full_scans = {}
+    for query_name, sql in queries.items():
+        full_scans[query_name] = get_full_scans(conn, sql)
+        if len(full_scans[query_name]) > 0:
+            print("Full scans in", query_name, full_scans[query_name])
     conn.close()
 
+    return full_scans
+
 
-def bulk_import(input_dir, output_dir, zip_file, import_fn=json_to_custom, limit=None):
-    """ Convert a directory of db files using import_fn
+def bulk_import(input_dir, output_dir, zip_file, import_fn=json_to_custom, limit=None, workers=1, failed=None):
+    """ Convert a directory of db files using import_fn. With more than one worker each zip file is
+    converted in its own process, so import_fn must be a module level function.
+    A failed conversion raises its exception unless a failed dict is given, in which case the exception is
+    stored in it and the other conversions continue.
     :param input_dir: full path to location of zip folder
     :param output_dir: full path to output folder
     :param zip_file: list of zip file names
     :param import_fn: function to convert zip to output format
     :param limit the number of processes to export
+    :param workers: number of zip files converted at the same time
+    :param failed: dict filled with the exceptions of failed conversions keyed by zip file name
     :return: list of db names
     """
 
     fn = []
-    for z in zip_file:
-        db_base_name = os.path.splitext(z)[0]
-        input_db = os.path.join(input_dir, z)
-        output_db = os.path.join(output_dir, db_base_name)
-        print("Importing", input_db, "...")
-        fn.append(import_fn(input_db, output_db, limit))
-        print("Exported to", output_db)
+
+    def collect(z, output_db, get_db):
+        try:
+            fn.append(get_db())
+            print("Exported to", output_db)
+        except Exception as e:
+            if failed is None:
+                raise
+            failed[z] = e
+            print("Failed to import", z, ":", e)
+
+    jobs = [(z, os.path.join(input_dir, z), os.path.join(output_dir, os.path.splitext(z)[0])) for z in zip_file]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for z, input_db, output_db in jobs:
+                print("Importing", input_db, "...")
+                futures.append((z, output_db, executor.submit(import_fn, input_db, output_db, limit)))
+            for z, output_db, future in futures:
+                collect(z, output_db, future.result)
+    else:
+        for z, input_db, output_db in jobs:
+            print("Importing", input_db, "...")
+            collect(z, output_db, lambda: import_fn(input_db, output_db, limit))
 
     return fn
@@ -105,6 +105,7 @@ def _(cpt, lookup=dict(), drop_index=True, units=None, non_zero=False, distinct_
 
     s = pd.Series(v)
     s.index.names = get_onset_names(cpt)
+    s.index = get_ref_id_index(cpt, s.index)
     df = pd.DataFrame(s, columns=[cpt.name])
 
     if units:
@@ -144,6 +145,7 @@ def _(cpt, lookup=dict(), drop_index=True, units=None):
     idx = cpt._index
     s = pd.Series({i: pe.value(cpt[i]) for i in idx})
     s.index.names = [j.name for j in idx.subsets()]
+    s.index = get_ref_id_index(cpt, s.index)
     df = pd.DataFrame(s, columns=[cpt.name])
 
     if units:
@@ -175,6 +177,21 @@ def _(cpt, lookup=dict(), units=None):
     return df
 
 
+def get_ref_id_index(cpt, index):
+    """
+    Map the integer keys in an index back to reference ids if the model instance was populated with
+    integer reference ids.
+
+    :param cpt: model component
+    :param pandas.Index index: index of component values
+    :return: pandas.Index
+    """
+    ref_id_map = getattr(cpt.model(), 'ref_id_map', None)
+    if ref_id_map is None:
+        return index
+    return ref_id_map.get_ref_id_index(index)
+
+
 @singledispatch
 def get_onset_names(entity):
     """
@@ -0,0 +1,49 @@
+# Benchmark of build_parameters and build_indexed_sets on growing configurations to check that the time
+# per parameter entry stays roughly constant, i.e. that the build scales linearly
+import time
+import io
+from contextlib import redirect_stdout
+import mola.build as mb
+import mola.specification5 as ms
+
+# Start of configuration
+
+# number of time intervals, each adds about 33 parameter entries to the General Specification
+time_intervals = [300, 3000, 30000]
+
+# End of configuration
+
+spec = ms.GeneralSpecification()
+print('Entries'.rjust(10), 'Seconds'.rjust(10), 'Microseconds per entry'.rjust(24))
+for n in time_intervals:
+    sets = spec.get_default_sets({
+        'F_m': ['fm1', 'fm2'], 'P_m': ['pm1', 'pm2'],
+        'F_t': ['ft1', 'ft2'], 'P_t': ['pt1', 'pt2'],
+        'F_s': ['fs1'], 'P_s': ['ps1'],
+        'T': ['t' + str(i) for i in range(n)],
+    })
+
+    # every default entry is already defined, which is the worst case for matching existing values
+    parameters = spec.get_default_parameters(sets)
+    entries = sum(len(v) for v in parameters.values())
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        mb.build_parameters(sets, parameters, spec)
+    seconds = time.perf_counter() - start
+    print(str(entries).rjust(10), '{:10.2f}'.format(seconds), '{:24.2f}'.format(1e6 * seconds / entries))
+
+# indexed sets of the Kondili State Task Network
+with redirect_stdout(io.StringIO()):
+    spec = ms.KondiliSpecification()
+print()
+print('Members'.rjust(10), 'Seconds'.rjust(10), 'Microseconds per member'.rjust(24))
+for n in [1000, 10000, 100000]:
+    sets = spec.get_default_sets({'I': ['i' + str(i) for i in range(n)], 'J': ['j' + str(i) for i in range(n)]})
+    indexed_sets = {'KI': {'i' + str(i): ['j' + str(i)] for i in range(n)}}
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        mb.build_indexed_sets(sets, indexed_sets, spec)
+    seconds = time.perf_counter() - start
+    print(str(n).rjust(10), '{:10.2f}'.format(seconds), '{:24.2f}'.format(1e6 * seconds / n))
@@ -1,6 +1,7 @@
-# Bulk export from derby to CSV and then use pandas to write the CSVs to a sqlite database
+# Bulk export from derby to CSV and then load the CSVs into a sqlite database
 from pathlib import Path
 import os
+import time
 import zipfile
 import mola.dataimport as di
 
@@ -40,19 +41,33 @@ sqlite_dir = Path('C:/data/openlca/sqlite/system')
 zip_dir = Path('C:/data/openlca/zip')
 db_dir = csv_path.joinpath(db)
 
+# Number of concurrent JDBC connections used to export the Derby tables
+workers = 4
+
+# Stream the Derby tables straight into sqlite rather than going through a CSV folder
+stream = False
+
 # End of configuration
 
-# convert Derby database to CSV
 conn = di.get_jdbc_connection(derby_db_dir.joinpath(db), derby_driver)
 table_names = di.get_derby_tables(conn)
-table_cols = di.get_derby_table_column_names(conn, table_names)
-csv_output_dir = di.derby_to_csv(conn, db_dir, separate_lob=True)
-conn.close()
-
-# generate sqlite db
-sqlite_file = sqlite_dir.joinpath('CSV_' + csv_output_dir.name + '.sqlite')
-di.csv_to_sqlite(csv_output_dir, sqlite_file, table_cols, chunk_size=1000000)
-di.create_csv_indices(sqlite_file)
+table_types = di.get_derby_table_column_types(conn, table_names)
+if stream:
+    # generate sqlite db directly from Derby
+    sqlite_file = sqlite_dir.joinpath('CSV_' + db_dir.name + '_' + time.strftime("%Y%m%d-%H%M%S") + '.sqlite')
+    di.derby_to_sqlite_stream(conn, sqlite_file, table_names, table_types)
+    conn.close()
+    di.create_csv_indices(sqlite_file)
+else:
+    # convert Derby database to CSV
+    table_cols = di.get_derby_table_column_names(conn, table_names)
+    conn.close()
+    csv_output_dir, export_time = di.derby_to_csv_parallel(derby_db_dir.joinpath(db), derby_driver, db_dir,
+                                                           separate_lob=True, workers=workers)
+
+    # generate sqlite db
+    sqlite_file = sqlite_dir.joinpath('CSV_' + csv_output_dir.name + '.sqlite')
+    di.csv_to_sqlite_bulk(csv_output_dir, sqlite_file, table_cols, table_types, chunk_size=1000000)
 
 # compress the sqlite file
 zip_file = zip_dir.joinpath(sqlite_file.with_suffix('.zip').name)
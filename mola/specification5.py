@@ -2,18 +2,20 @@
 A Specification object contains a pyomo model and methods to build the model.
 - adds binary variable for selection problem
 """
-import pygeodesy.formy as pygeo
 import math
+import time
 
 import pandas as pd
 import pyomo.environ as pe
 from pyomo.environ import units as pu
 import pyomo.dataportal as pyod
 import pyomo.network as pn
+from pyomo.core.expr.numeric_expr import LinearExpression
 
 import mola.sqlgenerator as sq
 import mola.dataimport as di
 import mola.build as mb
+import mola.utils as mu
 
 # units
 pu.load_definitions_from_strings([
@@ -29,6 +31,92 @@ pu.load_definitions_from_strings([
 ])
 
 
+def get_nonzero_keys(model, param_name, positions):
+    """
+    Group the keys of the nonzero values of a Param by the key elements at the given positions, so that
+    rules only iterate over nonzero terms. The grouping is built once and cached on the model.
+
+    :param model: concrete model
+    :param str param_name: name of Param
+    :param tuple positions: positions of the key elements to group by
+    :return: dict of lists of keys
+    """
+    cache = getattr(model, '_nonzero_keys', None)
+    if cache is None:
+        cache = model._nonzero_keys = {}
+    if (param_name, positions) not in cache:
+        groups = {}
+        for key, value in model.component(param_name).sparse_items():
+            if pe.value(value) != 0:
+                groups.setdefault(tuple(key[i] for i in positions), []).append(key)
+        cache[param_name, positions] = groups
+    return cache[param_name, positions]
+
+
+def get_set_keys(model, set_name, positions):
+    """
+    Group the elements of a multi-dimensional Set by the elements at the given positions. The grouping is
+    built once and cached on the model.
+
+    :param model: concrete model
+    :param str set_name: name of Set
+    :param tuple positions: positions of the elements to group by
+    :return: dict of lists of set elements
+    """
+    cache = getattr(model, '_set_keys', None)
+    if cache is None:
+        cache = model._set_keys = {}
+    if (set_name, positions) not in cache:
+        groups = {}
+        for key in model.component(set_name):
+            groups.setdefault(tuple(key[i] for i in positions), []).append(key)
+        cache[set_name, positions] = groups
+    return cache[set_name, positions]
+
+
+def get_transport_links(model):
+    """
+    Get forward and reverse adjacency indexes of the material and transport flows linked by nonzero J.
+
+    :param model: concrete model
+    :return: tuple of dicts, (fm, pm) to list of (ft, pt) and (ft, pt) to list of (fm, pm)
+    """
+    links = getattr(model, '_transport_links', None)
+    if links is None:
+        forward = {}
+        reverse = {}
+        j_link = model.component('J_link')
+        for fm, pm, ft, pt in get_nonzero_keys(model, 'J', ()).get((), []):
+            if j_link is not None and (fm, pm, ft, pt) not in j_link:
+                continue
+            forward.setdefault((fm, pm), []).append((ft, pt))
+            reverse.setdefault((ft, pt), []).append((fm, pm))
+        links = model._transport_links = (forward, reverse)
+    return links
+
+
+def get_distances(model):
+    """
+    Get the haversine distances between the process locations XI, YI and the task locations X, Y of a model.
+    The distances are calculated once per model.
+
+    :param model: concrete model
+    :return: tuple of process index dict, task index dict and distance matrix in km
+    """
+    distances = getattr(model, '_distances', None)
+    if distances is None:
+        process_keys = list(model.XI.sparse_keys())
+        task_keys = list(model.X.sparse_keys())
+        process_coordinates = tuple((pe.value(model.YI[key]), pe.value(model.XI[key])) for key in process_keys)
+        task_coordinates = tuple((pe.value(model.Y[key]), pe.value(model.X[key])) for key in task_keys)
+        distances = model._distances = (
+            {key: i for i, key in enumerate(process_keys)},
+            {key: j for j, key in enumerate(task_keys)},
+            mb.get_haversine_distances(process_coordinates, task_coordinates)
+        )
+    return distances
+
+
 class Specification:
     """ Abstract Specification of a Pyomo model for configuration in a GUI """
     name: str
@@ -49,7 +137,7 @@ class Specification:
         pass
 
     def populate(self, json_files: list, db_file: str):
-        """ Make abstract model concrete using db_file and json files """
+        """ Make abstract model concrete using db_file and json files or dicts of json data """
         pass
 
     def get_default_sets(self):
@@ -118,7 +206,39 @@ class GeneralSpecification(Specification):
     controllers = {"Standard": "StandardController"}
     default_settings = {
         'distance_calculated': {'value': False, 'type': 'boolean', 'doc': 'Calculate distance using openLCA data'},
-        'test_setting': {'value': False, 'type': 'boolean', 'doc': 'Test Setting'}
+        'test_setting': {'value': False, 'type': 'boolean', 'doc': 'Test Setting'},
+        'integer_ref_ids': {'value': False, 'type': 'boolean',
+                            'doc': 'Use integer keys for openLCA reference ids in the model'},
+        'prune_elementary_flows': {'value': False, 'type': 'boolean',
+                                   'doc': 'Only use elementary flows in both the process exchanges and impact factors'},
+        'sparse_parameters': {'value': False, 'type': 'boolean',
+                              'doc': 'Only store the nonzero values of the sparse parameters in the configuration'},
+        'sparse_variables': {'value': False, 'type': 'boolean',
+                             'doc': 'Only create material and transport flow variables for J-linked product flows'},
+        'lazy_objectives': {'value': False, 'type': 'boolean',
+                            'doc': 'Only build the selected objective, the others are built on demand'},
+        'objective': {'value': 'Environmental_Impact', 'type': 'choice',
+                      'choices': ['Environmental_Impact', 'Cost', 'Environmental_Cost_Impact'],
+                      'doc': 'Objective built by populate when objectives are lazy'},
+    }
+    # parameters that are only iterated over their nonzero values and default to zero with sparse_parameters
+    sparse_parameters = ['C', 'J', 'L', 'calA', 'calB', 'calC']
+    # sets keyed by openLCA reference ids and the index sets of the db parameters
+    ref_id_sets = ['P_m', 'P_t', 'P_s', 'P', 'F_m', 'F_t', 'F_s', 'F', 'KPI', 'E', 'AF', 'AP', 'AKPI']
+    db_parameter_index = {
+        'Ef': ['KPI', 'E'],
+        'EF': ['E', 'F', 'P'],
+        'EI': ['KPI', 'F', 'P'],
+        'phi': ['F', 'P', 'T'],
+        'XI': ['P_m', 'F_m'],
+        'YI': ['P_m', 'F_m'],
+        'UU': ['F', 'P'],
+    }
+    # index sets of the flow variables, the full products of their sets unless sparse_variables is set
+    flow_index_sets = {
+        'FP_m': ['F_m', 'P_m'],
+        'J_link': ['F_m', 'P_m', 'F_t', 'P_t'],
+        'FP_ms': ['F', 'P'],
     }
 
     def __init__(self):
@@ -161,9 +281,8 @@ class GeneralSpecification(Specification):
         abstract_model.EF = pe.Param(abstract_model.E, abstract_model.F, abstract_model.P, default=0)
         abstract_model.phi = pe.Param(abstract_model.F, abstract_model.P, abstract_model.T, default=0)
 
-        def ei_rule(model, kpi, f, p):
-            return sum(model.Ef[kpi, e]*model.EF[e, f, p] for e in model.E)
-        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, rule=ei_rule)
+        # EI[kpi, f, p] = sum(Ef[kpi, e]*EF[e, f, p] for e in E) is computed sparsely in populate
+        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, default=0)
         abstract_model.XI = pe.Param(abstract_model.P_m, abstract_model.F_m, doc="Longitude", units=pu.degree)
         abstract_model.YI = pe.Param(abstract_model.P_m, abstract_model.F_m, doc="Latitude", units=pu.degree)
 
@@ -173,24 +292,30 @@ class GeneralSpecification(Specification):
         # distances calculated from db
         def distance_rule(model, pm, fm, k, t):
             if self.settings['distance_calculated']:
-                # need to strip units for call to pygeo.haversine
-                return pygeo.haversine(
-                    model.Y[k, t].value, model.X[k, t].value,
-                    model.YI[pm, fm].value, model.XI[pm, fm].value) / 1000 * pu.km
+                process_index, task_index, distances = get_distances(model)
+                return float(distances[process_index[pm, fm], task_index[k, t]]) * pu.km
             else:
                 return model.d[pm, fm, k, t]
         self.abstract_model.dd = pe.Param(abstract_model.P_m, abstract_model.F_m, abstract_model.K,
                                           abstract_model.T, rule=distance_rule, doc='Calculated distance',
                                           units=pu.km)
 
+        # index sets of the material and transport flow variables
+        abstract_model.FP_m = pe.Set(within=abstract_model.F_m * abstract_model.P_m,
+                                     doc='Material flows and the processes producing them')
+        abstract_model.J_link = pe.Set(within=abstract_model.F_m * abstract_model.P_m *
+                                       abstract_model.F_t * abstract_model.P_t,
+                                       doc='Material flows linked to transport flows')
+        abstract_model.FP_ms = pe.Set(within=abstract_model.F * abstract_model.P,
+                                      doc='Material and service flows and their processes')
+
         # Variables
-        abstract_model.Flow = pe.Var(abstract_model.F_m, abstract_model.P_m, abstract_model.K, abstract_model.T,
+        abstract_model.Flow = pe.Var(abstract_model.FP_m, abstract_model.K, abstract_model.T,
                                      within=pe.NonNegativeReals, doc='Material flow', units=pu.P_m)
-        abstract_model.Storage_Service_Flow = pe.Var(abstract_model.F, abstract_model.P, abstract_model.K,
+        abstract_model.Storage_Service_Flow = pe.Var(abstract_model.FP_ms, abstract_model.K,
                                                      abstract_model.T, within=pe.NonNegativeReals,
                                                      doc='Storage Service Flow', units=pu.P)
-        abstract_model.Specific_Material_Transport_Flow = pe.Var(abstract_model.F_m, abstract_model.P_m,
-                                                                 abstract_model.F_t, abstract_model.P_t,
+        abstract_model.Specific_Material_Transport_Flow = pe.Var(abstract_model.J_link,
                                                                  abstract_model.K, abstract_model.T,
                                                                  within=pe.NonNegativeReals,
                                                                  doc='Specific Material Transport Flow',
@@ -204,66 +329,96 @@ class GeneralSpecification(Specification):
                                                  within=pe.Binary,
                                                  doc='Selection of Demand Product')
 
+        # objective expressions only sum over the nonzero EI and phi coefficients and are shared by the objectives
+        def get_flow_variables(model, f, p, t):
+            variables = []
+            if (f, p) in model.FP_m:
+                variables += [model.Flow[f, p, k, t] for k in model.K]
+            if f in model.F_s and p in model.P_s:
+                variables += [model.Storage_Service_Flow[f, p, k, t] for k in model.K]
+            if f in model.F_t and p in model.P_t:
+                variables += [model.Specific_Transport_Flow[f, p, k, t] for k in model.K]
+            return variables
+
+        def get_linear_expression(terms):
+            coefficients, variables = [], []
+            for coefficient, flow_variables in terms:
+                coefficients += [coefficient] * len(flow_variables)
+                variables += flow_variables
+            return LinearExpression(constant=0, linear_coefs=coefficients, linear_vars=variables)
+
+        def environment_expression_rule(model, kpi):
+            return get_linear_expression(
+                (pe.value(model.EI[kpi, f, p]), get_flow_variables(model, f, p, t))
+                for _, f, p in get_nonzero_keys(model, 'EI', (0,)).get((kpi,), []) for t in model.T)
+
+        def cost_expression_rule(model):
+            return get_linear_expression(
+                (pe.value(model.phi[f, p, t]), get_flow_variables(model, f, p, t))
+                for f, p, t in get_nonzero_keys(model, 'phi', ()).get((), []))
+
+        self.expression_declarations = {
+            'Environmental_Impact_Expression': {'index': ['KPI'], 'rule': environment_expression_rule,
+                                                'doc': 'Environmental impact of the flows'},
+            'Cost_Expression': {'index': [], 'rule': cost_expression_rule, 'doc': 'Cost of the flows'},
+        }
+
         # objectives
         def environment_objective_rule(model, kpi):
-            return sum(model.Flow[fm, pm, k, t]*model.EI[kpi, fm, pm]
-                       for fm in model.F_m for pm in model.P_m for k in model.K for t in model.T) + \
-                    sum(model.Storage_Service_Flow[fs, ps, k, t] * model.EI[kpi, fs, ps]
-                        for fs in model.F_s for ps in model.P_s for k in model.K for t in model.T) + \
-                    sum(model.Specific_Transport_Flow[ft, pt, k, t] * model.EI[kpi, ft, pt]
-                        for ft in model.F_t for pt in model.P_t for k in model.K for t in model.T)
+            return model.Environmental_Impact_Expression[kpi]
 
         def cost_objective_rule(model):
-            return sum(model.Flow[fm, pm, k, t] * model.phi[fm, pm, t]
-                       for fm in model.F_m for pm in model.P_m for k in model.K for t in model.T) + \
-                    sum(model.Storage_Service_Flow[fs, ps, k, t] * model.phi[fs, ps, t]
-                        for fs in model.F_s for ps in model.P_s for k in model.K for t in model.T) + \
-                    sum(model.Specific_Transport_Flow[ft, pt, k, t] * model.phi[ft, pt, t]
-                        for ft in model.F_t for pt in model.P_t for k in model.K for t in model.T)
+            return model.Cost_Expression
 
         def objective_rule(model):
-            return model.u['environment'] * sum(model.w[kpi] * environment_objective_rule(model, kpi)
-                                                for kpi in model.KPI) + model.u['cost'] * cost_objective_rule(model)
-
-        abstract_model.Environmental_Impact = pe.Objective(
-            abstract_model.KPI, rule=environment_objective_rule,
-            doc='Minimise the environmental impact using openLCA data')
-        abstract_model.Cost = pe.Objective(rule=cost_objective_rule, doc='Minimise the cost using openLCA data')
-        abstract_model.Environmental_Cost_Impact = pe.Objective(rule=objective_rule,
-            doc='Minimise the environmental impact and cost using openLCA data')
+            return model.u['environment'] * sum(model.w[kpi] * model.Environmental_Impact_Expression[kpi]
+                                                for kpi in model.KPI) + model.u['cost'] * model.Cost_Expression
+
+        # objectives are declared by name with their expressions so they can be built on demand with lazy_objectives
+        self.objective_declarations = {
+            'Environmental_Impact': {'index': ['KPI'], 'rule': environment_objective_rule,
+                                     'expressions': ['Environmental_Impact_Expression'],
+                                     'doc': 'Minimise the environmental impact using openLCA data'},
+            'Cost': {'index': [], 'rule': cost_objective_rule, 'expressions': ['Cost_Expression'],
+                     'doc': 'Minimise the cost using openLCA data'},
+            'Environmental_Cost_Impact': {'index': [], 'rule': objective_rule,
+                                          'expressions': ['Environmental_Impact_Expression', 'Cost_Expression'],
+                                          'doc': 'Minimise the environmental impact and cost using openLCA data'},
+        }
+        for name in self.expression_declarations:
+            abstract_model.add_component(name, self.get_expression(abstract_model, name))
+        for name in self.objective_declarations:
+            abstract_model.add_component(name, self.get_objective(abstract_model, name))
 
         # constraints
         def flow_demand_rule(model, d, k):
+            flow_processes = get_set_keys(model, 'FP_m', (0,))
             total_demand = sum(
                 model.Flow[fm, pm, k, t] * model.C[fm, k, d, t]
-                for fm in model.F_m for pm in model.P_m for t in model.T)
+                for fm, k, d, t in get_nonzero_keys(model, 'C', (1, 2)).get((k, d), [])
+                for _, pm in flow_processes.get((fm,), []))
             return total_demand >= model.Total_Demand[d, k]
         abstract_model.total_demand_constraint = pe.Constraint(
             abstract_model.D, abstract_model.K, rule=flow_demand_rule)
 
         def material_flow_rule(model, fm, pm, k, t):
+            forward, reverse = get_transport_links(model)
             return model.Flow[fm, pm, k, t] == sum(model.J[fm, pm, ft, pt] *
                                                    model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t]
-                                                   for ft in model.F_t for pt in model.P_t)
+                                                   for ft, pt in forward.get((fm, pm), []))
         abstract_model.material_flow_constraint = \
-            pe.Constraint(abstract_model.F_m, abstract_model.P_m,
-                          abstract_model.K, abstract_model.T, rule=material_flow_rule)
+            pe.Constraint(abstract_model.FP_m, abstract_model.K, abstract_model.T, rule=material_flow_rule)
 
         def specific_transport_flow_rule(model, ft, pt, k, t):
             rhs = 0
             # sum over connected processes
-            for fm in model.F_m:
-                for pm in model.P_m:
-                    if model.J[fm, pm, ft, pt]:
-                        unit_conversion = pu.convert_value(
-                            1,
-                            from_units=mb.map_units(model.UU[fm, pm]) * pu.km,
-                            to_units=mb.map_units(model.UU[ft, pt])
-                        )
-                        rhs += model.J[fm, pm, ft, pt] * \
-                               unit_conversion * \
-                               model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t] * \
-                               model.dd[pm, fm, k, t]
+            forward, reverse = get_transport_links(model)
+            for fm, pm in reverse.get((ft, pt), []):
+                unit_conversion = mb.get_transport_unit_conversion(model.UU[fm, pm], model.UU[ft, pt])
+                rhs += model.J[fm, pm, ft, pt] * \
+                       unit_conversion * \
+                       model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t] * \
+                       model.dd[pm, fm, k, t]
 
             return model.Specific_Transport_Flow[ft, pt, k, t] == rhs
 
@@ -281,13 +436,15 @@ class GeneralSpecification(Specification):
                                                                         rule=demand_selection_rule)
 
         def specific_demand_rule(model, d, k, t):
+            c_keys = get_nonzero_keys(model, 'C', (1, 2, 3)).get((k, d, t), [])
+            flow_processes = get_set_keys(model, 'FP_m', (0,))
             if t == model.T.first():
                 total_flow = sum(model.Flow[fm, pm, k, t] * model.C[fm, k, d, t]
-                                 for fm in model.F_m for pm in model.P_m)
+                                 for fm, k, d, t in c_keys for _, pm in flow_processes.get((fm,), []))
             else:
                 total_flow = sum((model.Flow[fm, pm, k, t] - model.Storage_Service_Flow[fm, pm, k, t] +
                                  model.Storage_Service_Flow[fm, pm, k, model.T.prev(t)]) * model.C[fm, k, d, t]
-                                 for fm in model.F_m for pm in model.P_m)
+                                 for fm, k, d, t in c_keys for _, pm in flow_processes.get((fm,), []))
             return total_flow >= model.Demand[d, k, t] * model.Demand_Selection[d, k, t]
 
         abstract_model.specific_demand_constraint = pe.Constraint(abstract_model.D,
@@ -298,20 +455,25 @@ class GeneralSpecification(Specification):
         def service_flow_link_rule(model, fs, ps, k, t):
             return model.Storage_Service_Flow[fs, ps, k, t] == \
                    sum(model.L[fm, pm, fs, ps] * model.Storage_Service_Flow[fm, pm, k, t]
-                       for fm in model.F_m for pm in model.P_m)
+                       for fm, pm, fs, ps in get_nonzero_keys(model, 'L', (2, 3)).get((fs, ps), []))
 
         abstract_model.service_flow_link_constraint = pe.Constraint(
             abstract_model.F_s, abstract_model.P_s, abstract_model.K, abstract_model.T, rule=service_flow_link_rule)
 
         def task_port_rule(model, k, t):
             port = dict()
-            if len(model.calA) > 0:
-                rhs1 = sum(model.calA[fm, pm, k, t] * model.Flow[fm, pm, k, t] +
-                           model.calB[fm, pm, k, t] * model.Storage_Service_Flow[fm, pm, k, t] for
-                           fm in model.F_m for pm in model.P_m)
+            # the groupings are cached on the model, so the check is only computed once
+            cal_a = get_nonzero_keys(model, 'calA', (2, 3))
+            cal_b = get_nonzero_keys(model, 'calB', (2, 3))
+            cal_c = get_nonzero_keys(model, 'calC', (4, 5))
+            if len(cal_a) > 0 or len(cal_b) > 0 or len(cal_c) > 0:
+                rhs1 = sum(model.calA[fm, pm, k, t] * model.Flow[fm, pm, k, t] for
+                           fm, pm, k, t in cal_a.get((k, t), []) if (fm, pm) in model.FP_m) + \
+                    sum(model.calB[fm, pm, k, t] * model.Storage_Service_Flow[fm, pm, k, t] for
+                        fm, pm, k, t in cal_b.get((k, t), []))
                 rhs2 = sum(model.calC[fm, pm, ft, pt, k, t] *
                            model.Specific_Material_Transport_Flow[fm, pm, ft, pt, k, t] for
-                           fm in model.F_m for pm in model.P_m for ft in model.F_t for pt in model.P_t)
+                           fm, pm, ft, pt, k, t in cal_c.get((k, t), []) if (fm, pm, ft, pt) in model.J_link)
                 port['flow'] = rhs1 + rhs2
             return port
 
@@ -340,72 +502,277 @@ class GeneralSpecification(Specification):
         # user data
         for json_file in json_files:
             if json_file:
-                olca_dp.load(filename=json_file)
-
-        # simple set data from db (this data is not currently using in the model)
-        olca_dp.load(filename=db_file, using='sqlite3', query="SELECT REF_ID FROM TBL_FLOWS",
-                     set=self.abstract_model.AF)
-        olca_dp.load(filename=db_file, using='sqlite3', query="SELECT REF_ID FROM TBL_PROCESSES",
-                     set=self.abstract_model.AP)
-        olca_dp.load(filename=db_file, using='sqlite3', query="SELECT REF_ID FROM TBL_IMPACT_CATEGORIES",
-                     set=self.abstract_model.AKPI)
-
-        # import impact breakdown which needs elementary flows and query generator
-        flows = list(olca_dp.data('F_m')) + list(olca_dp.data('F_s')) + list(olca_dp.data('F_t'))
-        processes = list(olca_dp.data('P_m')) + list(olca_dp.data('P_s')) + list(olca_dp.data('P_t'))
-        if elementary_flow_ref_ids is None:
-            # elementary flows
-            olca_dp.load(filename=db_file, using='sqlite3',
-                         query="SELECT REF_ID FROM TBL_FLOWS WHERE FLOW_TYPE='ELEMENTARY_FLOW'",
-                         set=self.abstract_model.E)
+                mb.load_data(olca_dp, json_file)
+
+        # all db loads share one read-only connection
+        with mb.sqlite_pool(db_file) as conn:
+            # simple set data from db (this data is not currently using in the model)
+            olca_dp.load(filename=db_file, using='mola_sqlite3', query="SELECT REF_ID FROM TBL_FLOWS",
+                         set=self.abstract_model.AF)
+            olca_dp.load(filename=db_file, using='mola_sqlite3', query="SELECT REF_ID FROM TBL_PROCESSES",
+                         set=self.abstract_model.AP)
+            olca_dp.load(filename=db_file, using='mola_sqlite3', query="SELECT REF_ID FROM TBL_IMPACT_CATEGORIES",
+                         set=self.abstract_model.AKPI)
+
+            # import impact breakdown which needs elementary flows and query generator
+            flows = list(olca_dp.data('F_m')) + list(olca_dp.data('F_s')) + list(olca_dp.data('F_t'))
+            processes = list(olca_dp.data('P_m')) + list(olca_dp.data('P_s')) + list(olca_dp.data('P_t'))
+            process_table = sq.create_ref_id_table(conn, processes, 'PROCESS_REF_IDS')
+            exchange_data = self.get_exchange_data(conn, process_table, olca_dp.data('P_m'), olca_dp.data('T'))
+            if elementary_flow_ref_ids is None:
+                # elementary flows
+                if not self.settings.get('prune_elementary_flows'):
+                    olca_dp.load(filename=db_file, using='mola_sqlite3',
+                                 query="SELECT REF_ID FROM TBL_FLOWS WHERE FLOW_TYPE='ELEMENTARY_FLOW'",
+                                 set=self.abstract_model.E)
+
+                # only load KPI if required in optimisation
+                if len(olca_dp.data('KPI')) > 0:
+                    ice_sql = sq.build_impact_category_elementary_flow(ref_ids=olca_dp.data('KPI'))
+                    olca_dp.load(filename=db_file, using='mola_sqlite3', query=ice_sql,
+                                 param=self.abstract_model.Ef, index=(self.abstract_model.KPI, self.abstract_model.E))
+
+                # breakdown of process into elementary flows, product flow costs and db units
+                # TODO: allow the user to define the unit conversion using a setting and model.U
+                for param in ['EF', 'phi', 'UU']:
+                    olca_dp.__setitem__(param, exchange_data[param])
+
+                # only keep elementary flows with both an exchange and an impact factor
+                if self.settings.get('prune_elementary_flows'):
+                    self.prune_elementary_flows(olca_dp)
 
-            # only load KPI if required in optimisation
-            if len(olca_dp.data('KPI')) > 0:
-                ice_sql = sq.build_impact_category_elementary_flow(ref_ids=olca_dp.data('KPI'))
-                olca_dp.load(filename=db_file, using='sqlite3', query=ice_sql,
-                             param=self.abstract_model.Ef, index=(self.abstract_model.KPI, self.abstract_model.E))
-
-            # breakdown of process into elementary flows
-            pe_sql = sq.build_process_elementary_flow(process_ref_ids=processes)
-            olca_dp.load(filename=db_file, using='sqlite3', query=pe_sql, param=self.abstract_model.EF,
-                         index=(self.abstract_model.KPI, self.abstract_model.F, self.abstract_model.P))
-
-            # cost of product flow from process
-            pfc_sql = sq.build_product_flow_cost(process_ref_ids=processes, time=olca_dp.data('T'))
-            olca_dp.load(filename=db_file, using='sqlite3', query=pfc_sql, param=self.abstract_model.phi,
-                         index=(self.abstract_model.F, self.abstract_model.P, self.abstract_model.T))
-
-            # db units TODO: allow the user to define the unit conversion using a setting and model.U
-            olca_dp.load(filename=db_file, using='sqlite3',
-                         query=sq.build_product_flow_units(process_ref_ids=processes),
-                         param=self.abstract_model.UU, index=(self.abstract_model.F, self.abstract_model.P))
-
-        else:
-            # for testing
-            olca_dp.__setitem__('E', elementary_flow_ref_ids)
-            impact_factors = {(kpi, e): 2 for kpi in olca_dp.data('KPI') for e in olca_dp.data('E')}
-            process_breakdown = {(e, f, p): 3 for e in olca_dp.data('E') for f in flows for p in processes}
-            olca_dp.__setitem__('Ef', impact_factors)
-            olca_dp.__setitem__('EF', process_breakdown)
-
-        # load locations
-        p_m = list(olca_dp.data('P_m'))
-        olca_dp.load(filename=db_file, using='sqlite3', query=sq.build_location(process_ref_ids=p_m),
-                     param=(self.abstract_model.XI, self.abstract_model.YI))
+            else:
+                # for testing
+                olca_dp.__setitem__('E', elementary_flow_ref_ids)
+                impact_factors = {(kpi, e): 2 for kpi in olca_dp.data('KPI') for e in olca_dp.data('E')}
+                process_breakdown = {(e, f, p): 3 for e in olca_dp.data('E') for f in flows for p in processes}
+                olca_dp.__setitem__('Ef', impact_factors)
+                olca_dp.__setitem__('EF', process_breakdown)
+
+            # locations
+            olca_dp.__setitem__('XI', exchange_data['XI'])
+            olca_dp.__setitem__('YI', exchange_data['YI'])
+
+        # impacts of product flows
+        olca_dp.__setitem__('EI', mb.build_ei_data(olca_dp.data('Ef') if 'Ef' in olca_dp.keys() else {},
+                                                   olca_dp.data('EF'), list(olca_dp.data('KPI')), flows, processes))
+        self.query_times = mb.PooledSqliteTable.query_times
 
         # Generate task edges TODO: use an indexed set rather than a parameter
         edges = [(k1, k2) for k1 in olca_dp.data('K') for k2 in olca_dp.data('K')
                  if 'Arc' in olca_dp.keys() and olca_dp.data('Arc')[k1, k2]]
         olca_dp.__setitem__('task_link', edges)
 
+        # index sets of the material and transport flow variables
+        for set_name, index in self.get_flow_index_sets(olca_dp, exchange_data['FP']).items():
+            olca_dp.__setitem__(set_name, index)
+
+        # swap reference ids for integer keys before the instance hashes them
+        if self.settings.get('integer_ref_ids'):
+            ref_id_map = self.intern_ref_ids(olca_dp)
+
+        # a sparse configuration leaves out the zeros, so the sparse parameters only default to zero in sparse mode
+        default = 0 if self.settings.get('sparse_parameters') else pe.Param.NoValue
+        for param in self.sparse_parameters:
+            self.abstract_model.component(param).set_default(default)
+
+        # leave out all but the selected objective and its expressions, which build_objective adds later
+        abstract_model = self.abstract_model
+        if self.settings.get('lazy_objectives'):
+            abstract_model = self.abstract_model.clone()
+            for name in self.objective_declarations:
+                if name != self.settings['objective']:
+                    abstract_model.del_component(name)
+            for name in self.expression_declarations:
+                if name not in self.objective_declarations[self.settings['objective']]['expressions']:
+                    abstract_model.del_component(name)
+
         # use DataPortal to build concrete instance
-        model_instance = self.abstract_model.create_instance(olca_dp)
+        model_instance = abstract_model.create_instance(olca_dp)
+        if self.settings.get('integer_ref_ids'):
+            model_instance.ref_id_map = ref_id_map
+
+        # a task without nonzero task coefficients has a constant port flow, so an arc between two of them
+        # would expand to a trivial constraint
+        for arc in model_instance.task_arc.values():
+            if all('flow' in port.vars and pe.is_constant(port.vars['flow']) for port in arc.ports):
+                arc.deactivate()
 
         # Generate the constraints for the tasks
         pe.TransformationFactory("network.expand_arcs").apply_to(model_instance)
 
         return model_instance
 
+    def get_expression(self, model, name):
+        """
+        Create an objective expression from its declaration using the index sets of a model.
+
+        :param model: abstract or concrete model
+        :param str name: expression name
+        :return: Expression
+        """
+        declaration = self.expression_declarations[name]
+        idx = [model.component(i) for i in declaration['index']]
+        return pe.Expression(*idx, rule=declaration['rule'], doc=declaration['doc'])
+
+    def get_objective(self, model, name):
+        """
+        Create an objective from its declaration using the index sets of a model.
+
+        :param model: abstract or concrete model
+        :param str name: objective name
+        :return: Objective
+        """
+        declaration = self.objective_declarations[name]
+        idx = [model.component(i) for i in declaration['index']]
+        return pe.Objective(*idx, rule=declaration['rule'], doc=declaration['doc'])
+
+    def build_objective(self, model_instance, name):
+        """
+        Build an objective and its expressions left out of a model instance by the lazy_objectives setting.
+
+        :param model_instance: concrete model
+        :param str name: objective name
+        :return: Objective
+        """
+        for expression_name in self.objective_declarations[name]['expressions']:
+            if model_instance.component(expression_name) is None:
+                model_instance.add_component(expression_name, self.get_expression(model_instance, expression_name))
+        if model_instance.component(name) is None:
+            model_instance.add_component(name, self.get_objective(model_instance, name))
+        return model_instance.component(name)
+
+    def prune_elementary_flows(self, olca_dp):
+        """
+        Set E in a DataPortal to the elementary flows that appear in both the EF and Ef data and drop
+        the EF and Ef entries of the other flows, which cannot contribute to EI.
+
+        :param pyomo.dataportal.DataPortal olca_dp: DataPortal loaded with EF and Ef data
+        :return: list of elementary flow reference ids
+        """
+        ef = olca_dp.data('EF')
+        impact_factors = olca_dp.data('Ef') if 'Ef' in olca_dp.keys() else {}
+        impact_flows = {e for kpi, e in impact_factors}
+        elementary_flows = list(dict.fromkeys(e for e, f, p in ef if e in impact_flows))
+
+        e_set = set(elementary_flows)
+        olca_dp.__setitem__('E', elementary_flows)
+        olca_dp.__setitem__('EF', {k: v for k, v in ef.items() if k[0] in e_set})
+        olca_dp.__setitem__('Ef', {k: v for k, v in impact_factors.items() if k[1] in e_set})
+
+        return elementary_flows
+
+    def get_exchange_data(self, conn, process_ref_ids, p_m, time_labels):
+        """
+        Read the exchanges of the processes in a single query and split them into the EF, phi, UU, XI and YI
+        parameter data and the FP list of product flow and process pairs.
+
+        :param sqlite3.Connection conn: database connection
+        :param process_ref_ids: list of process reference ids or a Table from create_ref_id_table
+        :param list p_m: material process reference ids for the locations
+        :param list time_labels: list of time labels, costs are given for the first one
+        :return: dict of parameter data dicts
+        """
+        exchange_sql = sq.build_process_exchanges(process_ref_ids)
+        start = time.perf_counter()
+        rows = conn.execute(exchange_sql).fetchall()
+        mb.PooledSqliteTable.query_times.append((exchange_sql, time.perf_counter() - start))
+
+        # product flows of each process
+        product_flows = {}
+        for p, f, flow_type, amount, cost, units, x, y in rows:
+            if flow_type == 'PRODUCT_FLOW':
+                product_flows.setdefault(p, []).append(f)
+
+        p_m = set(p_m)
+        data = {'EF': {}, 'phi': {}, 'UU': {}, 'XI': {}, 'YI': {},
+                'FP': [(f, p) for p, flows in product_flows.items() for f in flows]}
+        for p, f, flow_type, amount, cost, units, x, y in rows:
+            if flow_type == 'ELEMENTARY_FLOW':
+                for product_flow in product_flows.get(p, []):
+                    data['EF'][f, product_flow, p] = amount
+            else:
+                if cost is not None:
+                    data['phi'][f, p, time_labels[0]] = cost
+                if units is not None:
+                    data['UU'][f, p] = units
+                if p in p_m:
+                    data['XI'][p, f] = x
+                    data['YI'][p, f] = y
+
+        return data
+
+    def get_flow_index_sets(self, olca_dp, product_flows):
+        """
+        Get the index sets of the flow variables. By default FP_m and J_link are the full products of their
+        sets. With the sparse_variables setting FP_m only holds the product flows of the processes that are
+        linked to a transport flow by J, and J_link only holds the links of those pairs. FP_ms always holds
+        the material and service pairs of the storage service flows.
+
+        :param pyomo.dataportal.DataPortal olca_dp: DataPortal loaded with the model data
+        :param list product_flows: list of (flow, process) tuples of the product flows in the database
+        :return: dict of set data
+        """
+        f_m, p_m, f_t, p_t, f_s, p_s = (list(olca_dp.data(s)) for s in ['F_m', 'P_m', 'F_t', 'P_t', 'F_s', 'P_s'])
+        fp_ms = list(dict.fromkeys([(fm, pm) for fm in f_m for pm in p_m] + [(fs, ps) for fs in f_s for ps in p_s]))
+        if not self.settings.get('sparse_variables'):
+            return {
+                'FP_m': [(fm, pm) for fm in f_m for pm in p_m],
+                'J_link': [(fm, pm, ft, pt) for fm in f_m for pm in p_m for ft in f_t for pt in p_t],
+                'FP_ms': fp_ms,
+            }
+
+        product_flows = set(product_flows)
+        j = olca_dp.data('J') if 'J' in olca_dp.keys() else {}
+        j_link = [key for key, value in j.items() if value != 0 and (key[0], key[1]) in product_flows]
+        return {
+            'FP_m': list(dict.fromkeys((fm, pm) for fm, pm, ft, pt in j_link)),
+            'J_link': j_link,
+            'FP_ms': fp_ms,
+        }
+
+    def intern_ref_ids(self, olca_dp):
+        """
+        Replace the reference ids in the sets and parameter indices of a DataPortal with integer keys.
+        mola.output.get_entity maps the keys back using the ref_id_map attribute of the model instance.
+
+        :param pyomo.dataportal.DataPortal olca_dp: DataPortal loaded with the model data
+        :return: RefIdMap
+        """
+        ref_id_map = mu.RefIdMap(self.ref_id_sets)
+        data_keys = list(olca_dp.keys())
+
+        # sets
+        for set_name in self.ref_id_sets:
+            if set_name in data_keys:
+                olca_dp.__setitem__(set_name, [ref_id_map.get_key(ref_id) for ref_id in olca_dp.data(set_name)])
+
+        # index sets of tuples
+        for set_name, index in self.flow_index_sets.items():
+            if set_name in data_keys:
+                olca_dp.__setitem__(set_name, [
+                    tuple(ref_id_map.get_key(k) if s in self.ref_id_sets else k for s, k in zip(index, key))
+                    for key in olca_dp.data(set_name)])
+
+        # parameters
+        param_index = {p: v['index'] for p, v in self.user_defined_parameters.items()}
+        param_index.update(self.db_parameter_index)
+        for param, index in param_index.items():
+            positions = [i for i, set_name in enumerate(index) if set_name in self.ref_id_sets]
+            if param not in data_keys or len(positions) == 0:
+                continue
+            param_data = olca_dp.data(param)
+            if len(index) == 1:
+                # json data keys single index parameters by 1-tuples
+                param_data = {ref_id_map.get_key(k[0] if isinstance(k, tuple) else k): v
+                              for k, v in param_data.items()}
+            else:
+                param_data = {tuple(ref_id_map.get_key(k) if i in positions else k for i, k in enumerate(key)): v
+                              for key, v in param_data.items()}
+            olca_dp.__setitem__(param, param_data)
+
+        return ref_id_map
+
     def get_default_sets(self, d=None):
         user_sets = {
             'F_m': [],
@@ -600,9 +967,8 @@ class SimpleSpecification(Specification):
         abstract_model.Ef = pe.Param(abstract_model.KPI, abstract_model.E, default=0)
         abstract_model.EF = pe.Param(abstract_model.E, abstract_model.F, abstract_model.P, default=0)
 
-        def ei_rule(model, kpi, f, p):
-            return sum(model.Ef[kpi, e]*model.EF[e, f, p] for e in model.E)
-        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, rule=ei_rule)
+        # EI[kpi, f, p] = sum(Ef[kpi, e]*EF[e, f, p] for e in E) is computed sparsely in populate
+        abstract_model.EI = pe.Param(abstract_model.KPI, abstract_model.F, abstract_model.P, default=0)
 
         # unit conversion factors
         abstract_model.UU = pe.Param(abstract_model.F, abstract_model.P, within=pe.Any)
@@ -644,27 +1010,23 @@ class SimpleSpecification(Specification):
         abstract_model.total_demand_constraint = pe.Constraint(abstract_model.D, rule=flow_demand_rule)
 
         def material_flow_rule(model, fm, pm):
+            forward, reverse = get_transport_links(model)
             return model.Flow[fm, pm] == sum(
                 model.J[fm, pm, ft, pt] * model.Specific_Material_Transport_Flow[fm, pm, ft, pt]
-                for ft in model.F_t for pt in model.P_t)
+                for ft, pt in forward.get((fm, pm), []))
         abstract_model.material_flow_constraint = \
             pe.Constraint(abstract_model.F_m, abstract_model.P_m, rule=material_flow_rule)
 
         def specific_transport_flow_rule(model, ft, pt):
             rhs = 0
             # sum over connected processes
-            for fm in model.F_m:
-                for pm in model.P_m:
-                    if model.J[fm, pm, ft, pt]:
-                        unit_conversion = pu.convert_value(
-                            1,
-                            from_units=mb.map_units(model.UU[fm, pm]) * pu.km,
-                            to_units=mb.map_units(model.UU[ft, pt])
-                        )
-                        rhs += model.J[fm, pm, ft, pt] * \
-                               unit_conversion * \
-                               model.Specific_Material_Transport_Flow[fm, pm, ft, pt] * \
-                               model.d[pm, fm]
+            forward, reverse = get_transport_links(model)
+            for fm, pm in reverse.get((ft, pt), []):
+                unit_conversion = mb.get_transport_unit_conversion(model.UU[fm, pm], model.UU[ft, pt])
+                rhs += model.J[fm, pm, ft, pt] * \
+                       unit_conversion * \
+                       model.Specific_Material_Transport_Flow[fm, pm, ft, pt] * \
+                       model.d[pm, fm]
             return model.Specific_Transport_Flow[ft, pt] == rhs
 
         abstract_model.transport_constraint = pe.Constraint(abstract_model.F_t,
@@ -698,7 +1060,7 @@ class SimpleSpecification(Specification):
         # user data
         for json_file in json_files:
             if json_file:
-                olca_dp.load(filename=json_file)
+                mb.load_data(olca_dp, json_file)
 
         # import impact breakdown which needs elementary flows and query generator
         flows = list(olca_dp.data('F_m')) + list(olca_dp.data('F_t'))
@@ -725,6 +1087,9 @@ class SimpleSpecification(Specification):
                      query=sq.build_product_flow_units(process_ref_ids=processes),
                      param=self.abstract_model.UU, index=(self.abstract_model.F, self.abstract_model.P))
 
+        # impacts of product flows
+        olca_dp.__setitem__('EI', mb.build_ei_data(olca_dp.data('Ef') if 'Ef' in olca_dp.keys() else {},
+                                                   olca_dp.data('EF'), list(olca_dp.data('KPI')), flows, processes))
 
         # use DataPortal to build concrete instance
         model_instance = self.abstract_model.create_instance(olca_dp)
@@ -872,7 +1237,7 @@ class AIMMSExampleSpecification(Specification):
         # user data
         for json_file in json_files:
             if json_file:
-                olca_dp.load(filename=json_file)
+                mb.load_data(olca_dp, json_file)
 
         # use DataPortal to build concrete instance
         model_instance = self.abstract_model.create_instance(olca_dp)
@@ -1087,7 +1452,7 @@ class KondiliSpecification(Specification):
         # user data
         for json_file in json_files:
             if json_file:
-                olca_dp.load(filename=json_file)
+                mb.load_data(olca_dp, json_file)
 
         # built-in sets
         map_I_J = {}
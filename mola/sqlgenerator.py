@@ -6,16 +6,48 @@ from pypika.terms import PseudoColumn
 import pypika.functions as pf
 
 
+def create_ref_id_table(conn, ref_ids, table_name='REF_IDS'):
+    """
+    Load a list of reference ids into an indexed temporary table on a sqlite connection so that queries
+    can join against it instead of inlining the ids. The table is replaced if it already exists.
+
+    :param sqlite3.Connection conn: database connection
+    :param list[str] ref_ids: reference ids
+    :param str table_name: name of temporary table
+    :return: pypika Table to pass to the query builders in place of the reference id list
+    """
+    c = conn.cursor()
+    c.execute('DROP TABLE IF EXISTS temp."%s"' % table_name)
+    c.execute('CREATE TEMP TABLE "%s" (REF_ID TEXT PRIMARY KEY) WITHOUT ROWID' % table_name)
+    c.executemany('INSERT OR IGNORE INTO temp."%s" VALUES (?)' % table_name, ((ref_id,) for ref_id in ref_ids))
+    c.close()
+
+    return Table(table_name, schema='temp')
+
+
+def select_ids(tbl, ref_ids):
+    """
+    Build a sub-query of the ids of the rows in a table with the given reference ids.
+
+    :param Table tbl: openLCA table with ID and REF_ID columns
+    :param ref_ids: list of reference ids or a Table from create_ref_id_table
+    :return: pypika Query
+    """
+    if isinstance(ref_ids, Table):
+        return Query.from_(ref_ids).join(tbl).on(tbl.REF_ID == ref_ids.REF_ID).select(tbl.ID)
+    return tbl.select(tbl.ID).where(tbl.REF_ID.isin(ref_ids))
+
+
 def build_process_elementary_flow(process_ref_ids):
     """
     Build a query to create a table of processes versus elementary flows from a sqlite db
     sourced from derby.
 
-    :param str[list] process_ref_ids: processes reference ids
+    :param process_ref_ids: list of process reference ids or a Table from create_ref_id_table
     :return: SQL string
     """
     processes = Table('TBL_PROCESSES')
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ids = select_ids(processes, process_ref_ids)
     exchanges = Table('TBL_EXCHANGES')
     flows = Table('TBL_FLOWS')
     # flow_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
@@ -50,6 +82,47 @@ def build_process_elementary_flow(process_ref_ids):
     return str(q)
 
 
+def build_process_exchanges(process_ref_ids):
+    """
+    Build a query to get the product and elementary flow exchanges of processes with their costs, units and
+    process locations, so that all the exchange data for a model can be read in one pass.
+
+    :param process_ref_ids: list of process reference ids or a Table from create_ref_id_table
+    :return: SQL string
+    """
+    exchanges = Table('TBL_EXCHANGES')
+    flows = Table('TBL_FLOWS')
+    processes = Table('TBL_PROCESSES')
+    units = Table('TBL_UNITS')
+    locations = Table('TBL_LOCATIONS')
+
+    # convert reference ids to openLCA process ids
+    process_ids = select_ids(processes, process_ref_ids)
+
+    # sub-query the exchanges table to limit join
+    sq = Query \
+        .from_(exchanges) \
+        .select(exchanges.F_OWNER, exchanges.F_FLOW, exchanges.F_UNIT,
+                exchanges.RESULTING_AMOUNT_VALUE, exchanges.COST_VALUE) \
+        .where(exchanges.F_OWNER.isin(process_ids))
+
+    # join exchanges to flows, processes, units and locations
+    q = Query \
+        .from_(sq) \
+        .left_join(flows).on(flows.ID == sq.F_FLOW) \
+        .left_join(processes).on(processes.ID == sq.F_OWNER) \
+        .left_join(units).on(units.ID == sq.F_UNIT) \
+        .left_join(locations).on(pf.Cast(processes.F_LOCATION, 'int') == locations.ID) \
+        .select(
+            processes.REF_ID.as_('P'), flows.REF_ID.as_('F'), flows.FLOW_TYPE,
+            sq.RESULTING_AMOUNT_VALUE, sq.COST_VALUE, units.NAME.as_('Units'),
+            locations.LONGITUDE.as_('X'), locations.LATITUDE.as_('Y')
+        ) \
+        .where(flows.FLOW_TYPE.isin(['PRODUCT_FLOW', 'ELEMENTARY_FLOW']))
+
+    return str(q)
+
+
 def build_impact_category_elementary_flow(ref_ids):
     """
     Build a query to create a table of impact category versus elementary flow from a sqlite openLCA
@@ -88,7 +161,7 @@ def build_location(process_ref_ids=None):
     """
     Create a table of longitudes and latitudes for each material process and its product flow.
 
-    :param list[str] process_ref_ids: list of material process reference ids
+    :param process_ref_ids: list of material process reference ids or a Table from create_ref_id_table
     :return: SQL string
     """
     exchanges = Table('TBL_EXCHANGES')
@@ -98,7 +171,7 @@ def build_location(process_ref_ids=None):
     e = Table('e')
 
     # convert reference ids to openLCA process ids
-    process_id = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_id = select_ids(processes, process_ref_ids)
 
     # sub-query exchanges table to limit
     sq = Query\
@@ -165,7 +238,7 @@ def build_product_flow_units(process_ref_ids):
     """
     Build a query to get processes and their product flow units.
 
-    :param list[str] process_ref_ids: list of process reference ids
+    :param process_ref_ids: list of process reference ids or a Table from create_ref_id_table
     :return: SQL string
     """
 
@@ -175,7 +248,7 @@ def build_product_flow_units(process_ref_ids):
     units = Table('TBL_UNITS')
 
     # convert reference ids to openLCA process ids
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ids = select_ids(processes, process_ref_ids)
 
     # sub-query the exchanges table to limit join
     sq = Query \
@@ -203,7 +276,7 @@ def build_product_flow_cost(process_ref_ids, time):
     Build a query to get the product flow costs from a list of process reference ids using a sqlite openLCA database.
 
     :param sqlite3.Connection conn: database connection
-    :param list[str] process_ref_ids: list of process reference ids
+    :param process_ref_ids: list of process reference ids or a Table from create_ref_id_table
     :param list time: list of time labels
     :return SQL string
     """
@@ -213,7 +286,7 @@ def build_product_flow_cost(process_ref_ids, time):
     locations = Table('TBL_LOCATIONS')
 
     # get the process ids from the ref ids
-    process_ids = processes.select(processes.ID).where(processes.REF_ID.isin(process_ref_ids))
+    process_ids = select_ids(processes, process_ref_ids)
 
     # sub-query the exchanges table to limit join
     sq = Query\
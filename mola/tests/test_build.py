@@ -1,7 +1,13 @@
 # Unit tests for build functions
+import json
 from unittest import TestCase
 import mola.build as mb
+import mola.utils as mu
 import mola.specification5 as ms
+import mola.dataimport as di
+import pyomo.environ as pe
+import pyomo.dataportal as pyod
+import pandas as pd
 
 
 class TestBuild(TestCase):
@@ -23,3 +29,89 @@ class TestBuild(TestCase):
 
         spec1 = mb.create_specification(cls, settings={'distance_calculated': True})
         self.assertEqual(spec1.settings['distance_calculated'], True)
+
+    def test_sqlite_pool(self):
+        model = pe.AbstractModel()
+        model.AF = pe.Set()
+        model.AP = pe.Set()
+        db_file = di.get_default_db_file()
+        dp = pyod.DataPortal()
+        with mb.sqlite_pool(db_file) as conn:
+            dp.load(filename=db_file, using='mola_sqlite3', query="SELECT REF_ID FROM TBL_FLOWS", set=model.AF)
+            dp.load(filename=db_file, using='mola_sqlite3', query="SELECT REF_ID FROM TBL_PROCESSES", set=model.AP)
+        self.assertEqual([q for q, t in mb.PooledSqliteTable.query_times],
+                         ["SELECT REF_ID FROM TBL_FLOWS", "SELECT REF_ID FROM TBL_PROCESSES"])
+        self.assertGreater(len(dp.data('AF')), 0)
+        self.assertNotIn(db_file, mb.PooledSqliteTable.connections)
+        self.assertRaises(Exception, conn.execute, "SELECT 1")
+
+    def test_build_ei_data(self):
+        impact_factors = {('kpi1', 'e1'): 2.0, ('kpi1', 'e2'): 3.0, ('kpi2', 'e3'): 1.0}
+        process_breakdown = {('e1', 'f1', 'p1'): 1.0, ('e2', 'f1', 'p1'): 10.0, ('e2', 'f2', 'p2'): 1.0}
+        ei = mb.build_ei_data(impact_factors, process_breakdown, ['kpi1', 'kpi2'], ['f1', 'f2'], ['p1', 'p2'])
+        self.assertEqual(ei, {('kpi1', 'f1', 'p1'): 32.0, ('kpi1', 'f2', 'p2'): 3.0})
+
+    def test_sparse_parameters(self):
+        config = mb.get_config('test_model_config.json')
+        spec = mb.create_specification(config['specification'])
+        sparse_parameters = mb.get_sparse_parameters(config['parameters'], spec)
+        self.assertTrue(all(iv['value'] != 0 for iv in sparse_parameters['J']))
+        self.assertLessEqual(len(sparse_parameters['calC']), len(config['parameters']['calC']))
+
+        # nonzero values are restored over the defaults
+        parameters = spec.get_default_parameters(config['sets'])
+        mb.update_parameters(parameters, sparse_parameters, spec)
+        self.assertEqual(parameters['J'], config['parameters']['J'])
+
+        instance = mb.build_instance(config, settings={'sparse_parameters': True})
+        self.assertEqual(len(instance), 1)
+
+    def test_get_haversine_distances(self):
+        # London and Paris against Paris
+        distances = mb.get_haversine_distances(((51.5, -0.1), (48.8, 2.35)), ((48.8, 2.35),))
+        self.assertEqual(distances.shape, (2, 1))
+        self.assertAlmostEqual(distances[0, 0], 347.241742780592, places=6)
+        self.assertEqual(distances[1, 0], 0)
+        mb.get_haversine_distances(((51.5, -0.1), (48.8, 2.35)), ((48.8, 2.35),))
+        self.assertGreater(mb.get_haversine_distances.cache_info().hits, 0)
+
+    def test_get_transport_unit_conversion(self):
+        self.assertAlmostEqual(mb.get_transport_unit_conversion('kg', 't*km'), 0.001)
+        mb.get_transport_unit_conversion('kg', 't*km')
+        self.assertGreater(mb.get_transport_unit_conversion.cache_info().hits, 0)
+
+    def test_load_data(self):
+        file_dp = pyod.DataPortal()
+        dict_dp = pyod.DataPortal()
+        for json_file in ['test_cost_set_data.json', 'test_cost_parameters_data.json']:
+            file_dp.load(filename=json_file)
+            with open(json_file) as fp:
+                mb.load_data(dict_dp, json.load(fp))
+        self.assertEqual(list(dict_dp.keys()), list(file_dp.keys()))
+        for name in file_dp.keys():
+            self.assertEqual(dict_dp.data(name), file_dp.data(name))
+
+    def test_build_parameters(self):
+        spec = ms.GeneralSpecification()
+        sets = spec.get_default_sets({'F_m': ['fm1', 'fm2'], 'T': ['t1', 't2']})
+        parameters = {'C': [{'index': ['fm2', 'k1', 'd1', 't2'], 'value': 1},
+                            {'index': ['fm2', 'k1', 'd1', 't2'], 'value': 2}]}
+        par = mb.build_parameters(sets, parameters, spec, index_value=True)
+        self.assertEqual(len(par['C']), 4)
+        self.assertEqual([c['value'] for c in par['C']], [0, 0, 0, 2])
+
+        # the editor frames keep the layout of the frames built row by row
+        par = mb.build_parameters(sets, parameters, spec)
+        default_parameters = spec.get_default_parameters(sets)
+        rows = [pd.DataFrame({'Index': [el['index']], 'Value': 2 if el['index'] == ['fm2', 'k1', 'd1', 't2']
+                              else el['value']}, index=[0]) for el in default_parameters['C']]
+        pd.testing.assert_frame_equal(par['C'], pd.concat(rows, ignore_index=True))
+
+    def test_build_instance_parameter_tables(self):
+        config = mb.get_config('test_model_config.json')
+        instance = mb.build_instance(config)
+        config['parameters'] = {p: mu.ParameterTable.from_index_value(v) if isinstance(v, list) else v
+                                for p, v in config['parameters'].items()}
+        table_instance = mb.build_instance(config, settings={'sparse_parameters': True})
+        for p in ['C', 'J', 'd', 'w']:
+            self.assertEqual(instance.component(p).extract_values(), table_instance.component(p).extract_values())
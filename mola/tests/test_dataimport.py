@@ -3,6 +3,19 @@ from unittest import TestCase
 from pathlib import Path
 import mola.dataimport as di
 import tempfile
+import zipfile
+import json
+import os
+import shutil
+import threading
+import subprocess
+import sys
+import time
+import pytest
+
+resources_folder = Path(__file__).parent.parent / 'resources'
+derby_folder = resources_folder / 'db' / 'derby' / 'juice_empty'
+derby_jar = Path(os.environ.get('DERBY_JAR', resources_folder / 'db' / 'derby' / 'derby.jar'))
 
 
 class DataImport(TestCase):
@@ -31,3 +44,321 @@ class DataImport(TestCase):
         df_dict = di.get_derby(conn, table_name=[['APP', 'TBL_PROCESSES']])
         conn.close()
         self.assertEqual(len(df_dict), 1)
+
+    @pytest.mark.skipif(shutil.which('java') is None or not derby_folder.exists() or not derby_jar.exists(),
+                        reason='needs a JVM, the Derby jar (DERBY_JAR) and the Derby test database')
+    def test_derby_to_csv_parallel(self):
+        csv_folder, export_time = di.derby_to_csv_parallel(derby_folder, derby_jar, tempfile.mktemp(), workers=2)
+        self.assertTrue(csv_folder.exists())
+        self.assertIn('TBL_PROCESSES', export_time)
+
+    def test_csv_to_sqlite_bulk(self):
+        csv_folder = tempfile.mkdtemp()
+        with open(csv_folder + '/TBL_FLOWS.csv', 'w') as fp:
+            fp.write('1,"f1",2.5\n2,"f2",\n')
+        table_cols = {'TBL_FLOWS': ['ID', 'REF_ID', 'VALUE']}
+        table_types = {'TBL_FLOWS': {'ID': 'INTEGER', 'REF_ID': 'TEXT', 'VALUE': 'REAL'}}
+        db_file = di.csv_to_sqlite_bulk(csv_folder, tempfile.mktemp(), table_cols, table_types,
+                                        create_indices=False)
+        conn = di.get_sqlite_connection(db_file)
+        rows = conn.execute('SELECT * FROM TBL_FLOWS').fetchall()
+        conn.close()
+        self.assertEqual(rows, [(1, 'f1', 2.5), (2, 'f2', None)])
+
+        # without table types the columns are typed from the first rows
+        db_file = di.csv_to_sqlite_bulk(csv_folder, tempfile.mktemp(), table_cols, create_indices=False)
+        conn = di.get_sqlite_connection(db_file)
+        rows = conn.execute('SELECT * FROM TBL_FLOWS').fetchall()
+        conn.close()
+        self.assertEqual(rows, [(1, 'f1', 2.5), (2, 'f2', None)])
+
+    def test_get_csv_column_types(self):
+        rows = [['1', 'f1', '2.5', None], ['2', '3', '1', None]]
+        col_types = di.get_csv_column_types(rows, ['ID', 'REF_ID', 'VALUE', 'COST'], {'ID': 'TEXT'})
+        self.assertEqual(col_types, {'ID': 'TEXT', 'REF_ID': 'TEXT', 'VALUE': 'REAL', 'COST': 'NUMERIC'})
+
+    def test_csv_to_sqlite_bulk_resume(self):
+        csv_folder = tempfile.mkdtemp()
+        with open(csv_folder + '/TBL_FLOWS.csv', 'w') as fp:
+            fp.write(''.join('%d,"f%d"\n' % (i, i) for i in range(5)))
+        table_cols = {'TBL_FLOWS': ['ID', 'REF_ID']}
+        db_file = tempfile.mktemp()
+
+        # simulate an import interrupted after the first chunk with an uncommitted row left behind
+        conn = di.get_sqlite_connection(db_file)
+        conn.execute('CREATE TABLE TBL_FLOWS ("ID", "REF_ID")')
+        conn.executemany('INSERT INTO TBL_FLOWS VALUES (?, ?)', [(0, 'f0'), (1, 'f1'), (2, 'f2')])
+        di.get_checkpoints(conn)
+        di.set_checkpoint(conn.cursor(), 'TBL_FLOWS', 1, 2)
+        conn.commit()
+        conn.close()
+
+        di.csv_to_sqlite_bulk(csv_folder, db_file, table_cols, chunk_size=2, create_indices=False, resume=True)
+        conn = di.get_sqlite_connection(db_file)
+        rows = conn.execute('SELECT ID FROM TBL_FLOWS').fetchall()
+        checkpoints = di.get_checkpoints(conn)
+        conn.close()
+        self.assertEqual([int(r[0]) for r in rows], list(range(5)))
+        self.assertTrue(checkpoints['TBL_FLOWS'][2])
+
+    def test_truncate_to_checkpoints(self):
+        conn = di.get_sqlite_connection(':memory:')
+        conn.execute('CREATE TABLE TBL_FLOWS (ID)')
+        conn.execute('CREATE TABLE TBL_UNITS (ID)')
+        conn.executemany('INSERT INTO TBL_FLOWS VALUES (?)', [(i,) for i in range(5)])
+        conn.executemany('INSERT INTO TBL_UNITS VALUES (?)', [(i,) for i in range(5)])
+        di.get_checkpoints(conn)
+        di.set_checkpoint(conn.cursor(), 'TBL_FLOWS', 1, 3)
+
+        # rows of a table without a checkpoint have not been committed with one
+        di.truncate_to_checkpoints(conn, di.get_checkpoints(conn))
+        n_flows = conn.execute('SELECT COUNT(*) FROM TBL_FLOWS').fetchone()[0]
+        n_units = conn.execute('SELECT COUNT(*) FROM TBL_UNITS').fetchone()[0]
+        conn.close()
+        self.assertEqual((n_flows, n_units), (3, 0))
+
+    def test_csv_to_sqlite_bulk_kill_and_resume(self):
+        n = 400000
+        csv_folder = tempfile.mkdtemp()
+        with open(csv_folder + '/TBL_FLOWS.csv', 'w') as fp:
+            fp.write(''.join('%d,"f%d"\n' % (i, i) for i in range(n)))
+        db_file = tempfile.mktemp()
+
+        # kill an import in another process part way through a transaction, with a small page cache so that
+        # uncommitted pages have already been written to the database file
+        code = "import mola.dataimport as di; di.csv_to_sqlite_bulk(%r, %r, {'TBL_FLOWS': ['ID', 'REF_ID']}, " \
+               "chunk_size=100000, cache_size=64, create_indices=False, resume=True)" % (csv_folder, db_file)
+        env = dict(os.environ, PYTHONPATH=str(Path(__file__).parents[2]))
+        proc = subprocess.Popen([sys.executable, '-u', '-c', code], stdout=subprocess.PIPE, env=env, text=True)
+        for line in proc.stdout:
+            if line.startswith('Exported chunk 0'):
+                time.sleep(0.1)
+                proc.kill()
+                break
+        proc.wait()
+        proc.stdout.close()
+
+        di.csv_to_sqlite_bulk(csv_folder, db_file, {'TBL_FLOWS': ['ID', 'REF_ID']}, chunk_size=100000,
+                              create_indices=False, resume=True)
+        conn = di.get_sqlite_connection(db_file)
+        integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        count, distinct = conn.execute('SELECT COUNT(*), COUNT(DISTINCT ID) FROM TBL_FLOWS').fetchone()
+        conn.close()
+        self.assertEqual(integrity, 'ok')
+        self.assertEqual((count, distinct), (n, n))
+
+    def test_get_sqlite_type(self):
+        self.assertEqual(di.get_sqlite_type('BIGINT NOT NULL'), 'INTEGER')
+        self.assertEqual(di.get_sqlite_type('DOUBLE'), 'REAL')
+        self.assertEqual(di.get_sqlite_type('VARCHAR(255)'), 'TEXT')
+
+    def test_derby_to_sqlite_stream(self):
+        # a sqlite database attached as the APP schema stands in for the Derby connection
+        source_file = tempfile.mktemp()
+        conn = di.get_sqlite_connection(source_file)
+        conn.execute('CREATE TABLE TBL_FLOWS (ID INTEGER, REF_ID TEXT)')
+        conn.executemany('INSERT INTO TBL_FLOWS VALUES (?, ?)', [(i, 'f' + str(i)) for i in range(25)])
+        conn.commit()
+        conn.close()
+        conn = di.get_sqlite_connection(':memory:')
+        conn.execute("ATTACH DATABASE '%s' AS APP" % source_file)
+
+        db_file = di.derby_to_sqlite_stream(conn, tempfile.mktemp(), table_name=['TBL_FLOWS'], batch_size=10,
+                                            queue_size=1)
+        conn.close()
+        conn = di.get_sqlite_connection(db_file)
+        n = conn.execute('SELECT COUNT(*) FROM TBL_FLOWS').fetchone()[0]
+        conn.close()
+        self.assertEqual(n, 25)
+
+    def test_derby_to_sqlite_stream_resume(self):
+        # rows stored out of key order so that resuming by row position would skip and repeat rows
+        source_file = tempfile.mktemp()
+        conn = di.get_sqlite_connection(source_file)
+        conn.execute('CREATE TABLE TBL_FLOWS (ID INTEGER, REF_ID TEXT)')
+        conn.executemany('INSERT INTO TBL_FLOWS VALUES (?, ?)', [(i, 'f' + str(i)) for i in reversed(range(25))])
+        conn.commit()
+        conn.close()
+
+        # simulate an import interrupted after the first batch
+        db_file = tempfile.mktemp()
+        conn = di.get_sqlite_connection(db_file)
+        conn.execute('CREATE TABLE TBL_FLOWS (ID INTEGER, REF_ID TEXT)')
+        conn.executemany('INSERT INTO TBL_FLOWS VALUES (?, ?)', [(i, 'f' + str(i)) for i in range(10)])
+        di.get_checkpoints(conn)
+        di.set_checkpoint(conn.cursor(), 'TBL_FLOWS', 1, 10)
+        conn.commit()
+        conn.close()
+
+        conn = di.get_sqlite_connection(':memory:')
+        conn.execute("ATTACH DATABASE '%s' AS APP" % source_file)
+        di.derby_to_sqlite_stream(conn, db_file, table_name=['TBL_FLOWS'], batch_size=10, resume=True)
+
+        # a failing read stops the writer thread instead of leaving it blocked
+        n_threads = threading.active_count()
+        with self.assertRaises(Exception):
+            di.derby_to_sqlite_stream(conn, tempfile.mktemp(), table_name=['TBL_MISSING'])
+        self.assertEqual(threading.active_count(), n_threads)
+        conn.close()
+
+        conn = di.get_sqlite_connection(db_file)
+        ids = [r[0] for r in conn.execute('SELECT ID FROM TBL_FLOWS ORDER BY ID')]
+        conn.close()
+        self.assertEqual(ids, list(range(25)))
+
+    def test_derby_to_sqlite_stream_link_table(self):
+        # link tables have no ID column to order and resume by
+        source_file = tempfile.mktemp()
+        conn = di.get_sqlite_connection(source_file)
+        conn.execute('CREATE TABLE TBL_PRODUCT_SYSTEM_PROCESSES (F_PRODUCT_SYSTEM INTEGER, F_PROCESS INTEGER)')
+        conn.executemany('INSERT INTO TBL_PRODUCT_SYSTEM_PROCESSES VALUES (?, ?)', [(1, i) for i in range(25)])
+        conn.commit()
+        conn.close()
+        conn = di.get_sqlite_connection(':memory:')
+        conn.execute("ATTACH DATABASE '%s' AS APP" % source_file)
+
+        db_file = di.derby_to_sqlite_stream(conn, tempfile.mktemp(), table_name=['TBL_PRODUCT_SYSTEM_PROCESSES'],
+                                            batch_size=10)
+
+        # an interrupted import of the table starts again from scratch
+        resume_file = tempfile.mktemp()
+        resume_conn = di.get_sqlite_connection(resume_file)
+        resume_conn.execute('CREATE TABLE TBL_PRODUCT_SYSTEM_PROCESSES (F_PRODUCT_SYSTEM INTEGER, F_PROCESS INTEGER)')
+        resume_conn.executemany('INSERT INTO TBL_PRODUCT_SYSTEM_PROCESSES VALUES (?, ?)', [(1, i) for i in range(10)])
+        di.get_checkpoints(resume_conn)
+        di.set_checkpoint(resume_conn.cursor(), 'TBL_PRODUCT_SYSTEM_PROCESSES', 1, 10)
+        resume_conn.commit()
+        resume_conn.close()
+        di.derby_to_sqlite_stream(conn, resume_file, table_name=['TBL_PRODUCT_SYSTEM_PROCESSES'], batch_size=10,
+                                  resume=True)
+        conn.close()
+
+        for f in [db_file, resume_file]:
+            conn = di.get_sqlite_connection(f)
+            processes = [r[0] for r in conn.execute('SELECT F_PROCESS FROM TBL_PRODUCT_SYSTEM_PROCESSES')]
+            conn.close()
+            self.assertEqual(sorted(processes), list(range(25)))
+
+    def test_json_to_sqlite_resume(self):
+        zip_filename = tempfile.mktemp(suffix='.zip')
+        with zipfile.ZipFile(zip_filename, 'w') as zf:
+            zf.writestr('flows/f1.json', '{"@id": "f1"}')
+            zf.writestr('processes/p1.json', json.dumps({'@id': 'p1', 'exchanges': []}))
+        db_file_base = tempfile.mktemp()
+
+        # a one-shot load does not record checkpoints
+        db_file = di.json_to_sqlite(zip_filename, db_file_base)
+        conn = di.get_sqlite_connection(db_file)
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        conn.close()
+        self.assertNotIn('MOLA_CHECKPOINT', tables)
+        os.remove(db_file)
+
+        # a completed resumable load is not continued
+        db_file = di.json_to_sqlite(zip_filename, db_file_base, resume=True)
+        time.sleep(1)
+        self.assertNotEqual(di.json_to_sqlite(zip_filename, db_file_base, resume=True), db_file)
+        conn = di.get_sqlite_connection(db_file)
+        checkpoints = di.get_checkpoints(conn)
+        conn.close()
+        self.assertTrue(checkpoints[os.path.basename(zip_filename)][2])
+
+    def test_json_to_sqlite_parallel(self):
+        zip_filename = tempfile.mktemp(suffix='.zip')
+        with zipfile.ZipFile(zip_filename, 'w') as zf:
+            zf.writestr('meta.info', '{"client": "openLCA 1.10.2"}')
+            zf.writestr('flows/f1.json', '{"@id": "f1"}')
+            for p in ['p1', 'p2', 'p3']:
+                j = {'@id': p, 'exchanges': [{'flow': {'@id': 'f1'}, 'amount': 2.0, 'input': True}]}
+                zf.writestr('processes/' + p + '.json', json.dumps(j))
+        db_file = di.json_to_sqlite_parallel(zip_filename, tempfile.mktemp(), limit=2, workers=2, batch_size=2)
+        conn = di.get_sqlite_connection(db_file)
+        n_processes = conn.execute('SELECT COUNT(*) FROM processes').fetchone()[0]
+        exchanges = conn.execute('SELECT flowid, input, amount FROM process_exchanges').fetchall()
+        conn.close()
+        self.assertEqual(n_processes, 2)
+        self.assertEqual(exchanges, [('f1', 1, 2.0)] * 2)
+
+    def test_bulk_import(self):
+        input_dir = tempfile.mkdtemp()
+        with zipfile.ZipFile(input_dir + '/good.zip', 'w') as zf:
+            zf.writestr('processes/p1.json', json.dumps({'@id': 'p1', 'exchanges': []}))
+        with open(input_dir + '/bad.zip', 'w') as fp:
+            fp.write('not a zip file')
+        failed = {}
+        fn = di.bulk_import(input_dir, tempfile.mkdtemp(), ['good.zip', 'bad.zip'], import_fn=di.json_to_sqlite,
+                            workers=2, failed=failed)
+        self.assertEqual(len(fn), 1)
+        self.assertIn('bad.zip', failed)
+
+        # without a failed dict the sequential conversion raises as before
+        with self.assertRaises(zipfile.BadZipFile):
+            di.bulk_import(input_dir, tempfile.mkdtemp(), ['bad.zip'], import_fn=di.json_to_sqlite)
+
+    def test_csv_to_sqlite_incremental(self):
+        csv_folder = tempfile.mkdtemp()
+        db_file = tempfile.mktemp()
+        table_cols = {'TBL_FLOWS': ['ID', 'REF_ID']}
+        with open(csv_folder + '/TBL_FLOWS.csv', 'w') as fp:
+            fp.writelines('%d,"f%d"\n' % (i, i) for i in range(10))
+        db_file, reloaded = di.csv_to_sqlite_incremental(csv_folder, db_file, table_cols, chunk_size=4,
+                                                         create_indices=False)
+        self.assertEqual(reloaded, {'TBL_FLOWS': [0, 1, 2]})
+
+        # change a row in the second chunk and drop the last chunk
+        with open(csv_folder + '/TBL_FLOWS.csv', 'w') as fp:
+            fp.writelines('%d,"f%d"\n' % (i, i if i != 5 else 99) for i in range(8))
+        db_file, reloaded = di.csv_to_sqlite_incremental(csv_folder, db_file, table_cols, chunk_size=4,
+                                                         create_indices=False)
+        self.assertEqual(reloaded, {'TBL_FLOWS': [1]})
+        conn = di.get_sqlite_connection(db_file)
+        rows = conn.execute('SELECT REF_ID FROM TBL_FLOWS ORDER BY rowid').fetchall()
+        conn.close()
+        self.assertEqual([r[0] for r in rows], ['f0', 'f1', 'f2', 'f3', 'f4', 'f99', 'f6', 'f7'])
+
+    def test_csv_to_sqlite_incremental_types(self):
+        # numbers are read back as numbers, also where the first rows are null
+        csv_folder = tempfile.mkdtemp()
+        table_cols = {'TBL_EXCHANGES': ['ID', 'RESULTING_AMOUNT_VALUE', 'COST_VALUE']}
+        with open(csv_folder + '/TBL_EXCHANGES.csv', 'w') as fp:
+            fp.writelines('%d,%g,%s\n' % (i, i / 2, '' if i < 5 else i) for i in range(10))
+        db_file, reloaded = di.csv_to_sqlite_incremental(csv_folder, tempfile.mktemp(), table_cols, chunk_size=4,
+                                                         create_indices=False, sample_size=5)
+        conn = di.get_sqlite_connection(db_file)
+        rows = conn.execute('SELECT * FROM TBL_EXCHANGES WHERE ID = 7').fetchall()
+        conn.close()
+        self.assertEqual(rows, [(7, 3.5, 7)])
+
+    def test_create_lca_indices(self):
+        db_file = tempfile.mktemp()
+        conn = di.get_sqlite_connection(db_file)
+        conn.execute('CREATE TABLE TBL_PROCESSES (ID, REF_ID, F_LOCATION)')
+        conn.execute('CREATE TABLE TBL_FLOWS (ID, REF_ID, FLOW_TYPE)')
+        conn.execute('CREATE TABLE TBL_EXCHANGES (ID, F_OWNER, F_FLOW, F_UNIT, F_CURRENCY, COST_VALUE, '
+                     'RESULTING_AMOUNT_VALUE)')
+        conn.execute('CREATE TABLE TBL_LOCATIONS (ID INTEGER, REF_ID TEXT, LONGITUDE REAL, LATITUDE REAL)')
+        conn.execute('CREATE TABLE TBL_UNITS (ID, REF_ID, NAME)')
+        conn.execute('CREATE TABLE TBL_IMPACT_CATEGORIES (ID, REF_ID)')
+        conn.execute('CREATE TABLE TBL_IMPACT_FACTORS (ID, F_IMPACT_CATEGORY, F_FLOW, VALUE)')
+        conn.commit()
+        conn.close()
+
+        self.assertGreater(len(di.check_query_plans(db_file)['build_location']), 0)
+        conn = di.get_sqlite_connection(db_file)
+        conn.execute('CREATE INDEX TBL_EXCHANGES_F_OWNER ON TBL_EXCHANGES(F_OWNER)')
+        conn.commit()
+        conn.close()
+
+        index_names = di.create_lca_indices(db_file)
+        self.assertIn('TBL_EXCHANGES_F_OWNER_F_FLOW_F_UNIT_RESULTING_AMOUNT_VALUE_COST_VALUE_F_CURRENCY', index_names)
+        self.assertIn('TBL_FLOWS_REF_ID_ID', index_names)
+        self.assertNotIn('TBL_PROCESSES_ID_REF_ID', index_names)
+        full_scans = di.check_query_plans(db_file)
+        self.assertIn('build_process_exchanges', full_scans)
+        self.assertEqual(sum(len(v) for v in full_scans.values()), 0)
+
+        # one index per access path
+        conn = di.get_sqlite_connection(db_file)
+        exchange_indices = [r[1] for r in conn.execute('PRAGMA index_list(TBL_EXCHANGES)')]
+        conn.close()
+        self.assertEqual(len(exchange_indices), 3)
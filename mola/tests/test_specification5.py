@@ -5,6 +5,8 @@ import mola.specification5 as sp
 import mola.build as mb
 import mola.utils as mu
 import json
+import pyomo.environ as pe
+from pyomo.repn import generate_standard_repn
 
 # TODO add a SimpleSpecification test
 
@@ -76,3 +78,124 @@ class TestScheduleSpecification(TestCase):
         sets_json.close()
         parameters_json.close()
         self.assertGreater(len(model_instance), 0)
+
+    def test_populate_integer_ref_ids(self):
+        spec = sp.GeneralSpecification()
+        spec.settings['integer_ref_ids'] = True
+        model_instance = spec.populate(['test_cost_set_data.json', 'test_cost_parameters_data.json'])
+        with open('test_cost_set_data.json') as fp:
+            p_m = json.load(fp)['P_m']
+        self.assertEqual([model_instance.ref_id_map.get_ref_id(k) for k in model_instance.P_m], p_m)
+
+        # single index parameters from a config
+        config = mb.get_config('test_model_config.json')
+        model_instance = mb.build_instance(config, settings={'integer_ref_ids': True})
+        self.assertEqual([model_instance.ref_id_map.get_ref_id(k) for k in model_instance.w],
+                         [p['index'][0] for p in config['parameters']['w']])
+
+    def test_populate_prune_elementary_flows(self):
+        config = mb.get_config('test_model_config.json')
+        model_instance = mb.build_instance(config)
+        pruned_instance = mb.build_instance(config, settings={'prune_elementary_flows': True})
+        self.assertLess(len(pruned_instance.E), len(model_instance.E))
+        for index, value in model_instance.EI.extract_values().items():
+            self.assertAlmostEqual(value, pruned_instance.EI[index])
+
+    def test_get_transport_links(self):
+        config = mb.get_config('test_model_config.json')
+        model_instance = mb.build_instance(config)
+        forward, reverse = sp.get_transport_links(model_instance)
+        links = [(fm, pm, ft, pt) for (fm, pm), v in forward.items() for ft, pt in v]
+        self.assertEqual(sorted(links), sorted(k for k, v in model_instance.J.items() if v != 0))
+        self.assertEqual(sorted(links), sorted((fm, pm, ft, pt) for (ft, pt), v in reverse.items() for fm, pm in v))
+
+    def test_populate_sparse_variables(self):
+        config = mb.get_config('test_model_config.json')
+        model_instance = mb.build_instance(config)
+        sparse_instance = mb.build_instance(config, settings={'sparse_variables': True})
+        self.assertLess(sparse_instance.nvariables(), model_instance.nvariables())
+        self.assertEqual(sorted(sparse_instance.J_link), sorted(k for k, v in model_instance.J.items() if v != 0))
+        self.assertEqual(sparse_instance.nconstraints(), model_instance.nconstraints())
+
+    def test_populate_task_port(self):
+        # an arc between tasks whose only nonzero task coefficient is in calB
+        config = mb.get_config('test_model_config.json')
+        sets = config['sets']
+        sets['K'] = ['k1', 'k2']
+        parameters = mb.build_parameters(sets, config['parameters'], self.spec, index_value=True)
+        for p in parameters['calB']:
+            if p['index'] == [sets['F_m'][0], sets['P_m'][0], 'k1', 't1']:
+                p['value'] = 1.0
+        for p in parameters['Arc']:
+            if p['index'] == ['k1', 'k2']:
+                p['value'] = 1
+        config['parameters'] = parameters
+        for sparse_parameters in [False, True]:
+            model_instance = mb.build_instance(config, settings={'sparse_parameters': sparse_parameters})
+            self.assertEqual(len(model_instance.task_arc_expanded[('k1', 'k2', 't1')].flow_equality), 1)
+        self.assertEqual(model_instance.calA[sets['F_m'][0], sets['P_m'][0], 'k1', 't1'], 0)
+
+    def test_populate_task_port_periods(self):
+        # tasks and periods without nonzero task coefficients have constant port flows
+        config = mb.get_config('test_model_config.json')
+        sets = config['sets']
+        sets['K'] = ['k1', 'k2']
+        sets['T'] = ['t1', 't2']
+        parameters = mb.build_parameters(sets, config['parameters'], self.spec, index_value=True)
+        for p in parameters['calB']:
+            if p['index'] == [sets['F_m'][0], sets['P_m'][0], 'k1', 't1']:
+                p['value'] = 1.0
+        for p in parameters['Arc']:
+            if p['index'] == ['k1', 'k2']:
+                p['value'] = 1
+        config['parameters'] = parameters
+        for sparse_parameters in [False, True]:
+            model_instance = mb.build_instance(config, settings={'sparse_parameters': sparse_parameters})
+            self.assertEqual(len(model_instance.task_arc_expanded[('k1', 'k2', 't1')].flow_equality), 1)
+            self.assertFalse(model_instance.task_arc[('k1', 'k2', 't2')].active)
+            self.assertIsNone(model_instance.task_arc_expanded[('k1', 'k2', 't2')].component('flow_equality'))
+
+    def test_populate_storage_service_flow(self):
+        config = mb.get_config('test_model_config.json')
+        model_instance = mb.build_instance(config)
+        sets = config['sets']
+        n = len(sets['F_m']) * len(sets['P_m']) + len(sets['F_s']) * len(sets['P_s'])
+        self.assertEqual(len(model_instance.Storage_Service_Flow), n * len(sets['K']) * len(sets['T']))
+
+    def test_objective_expressions(self):
+        config = mb.get_config('test_model_config.json')
+        model_instance = mb.build_instance(config)
+        combined = generate_standard_repn(model_instance.Environmental_Cost_Impact.expr)
+        coefficients = {}
+        for kpi in model_instance.KPI:
+            weight = pe.value(model_instance.u['environment'] * model_instance.w[kpi])
+            repn = generate_standard_repn(model_instance.Environmental_Impact[kpi].expr)
+            for v, c in zip(repn.linear_vars, repn.linear_coefs):
+                coefficients[v.name] = coefficients.get(v.name, 0) + weight * c
+        repn = generate_standard_repn(model_instance.Cost.expr)
+        for v, c in zip(repn.linear_vars, repn.linear_coefs):
+            coefficients[v.name] = coefficients.get(v.name, 0) + pe.value(model_instance.u['cost']) * c
+        combined_coefficients = {}
+        for v, c in zip(combined.linear_vars, combined.linear_coefs):
+            combined_coefficients[v.name] = combined_coefficients.get(v.name, 0) + c
+        self.assertGreater(len(coefficients), 0)
+        self.assertEqual(coefficients.keys(), combined_coefficients.keys())
+        for name, c in coefficients.items():
+            self.assertAlmostEqual(combined_coefficients[name], c)
+
+    def test_populate_lazy_objectives(self):
+        config = mb.get_config('test_model_config.json')
+        settings = {'lazy_objectives': True, 'objective': 'Cost'}
+        spec = mb.create_specification(config['specification'], settings)
+        model_instance = mb.build_instance(config, settings=settings)
+        self.assertEqual([o.name for o in model_instance.component_objects(pe.Objective)], ['Cost'])
+        self.assertEqual([e.name for e in model_instance.component_objects(pe.Expression)], ['Cost_Expression'])
+
+        objective = spec.build_objective(model_instance, 'Environmental_Impact')
+        self.assertIsNotNone(model_instance.component('Environmental_Impact_Expression'))
+        full_instance = mb.build_instance(config)
+        for kpi in full_instance.KPI:
+            lazy_repn = generate_standard_repn(objective[kpi].expr)
+            repn = generate_standard_repn(full_instance.Environmental_Impact[kpi].expr)
+            self.assertEqual([v.name for v in lazy_repn.linear_vars], [v.name for v in repn.linear_vars])
+            self.assertEqual(list(lazy_repn.linear_coefs), list(repn.linear_coefs))
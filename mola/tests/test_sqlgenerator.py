@@ -69,3 +69,19 @@ class TestSQLGenerator(TestCase):
         z = pd.read_sql(pfu_sql, self.conn)
         self.assertEqual(len(z), 1)
 
+    def test_create_ref_id_table(self):
+        p_m = ['f22f5f6e-1bdc-3cb5-8f48-8a04d8f9b768']
+        p_t = ['44ad59ca-4fe0-394c-a6d9-5dea68783c23']
+        ref_id_table = sq.create_ref_id_table(self.conn, p_m + p_t)
+        pe_sql = sq.build_process_elementary_flow(process_ref_ids=ref_id_table)
+        self.assertNotIn(p_m[0], pe_sql)
+        z = pd.read_sql(pe_sql, self.conn)
+        z_list = pd.read_sql(sq.build_process_elementary_flow(process_ref_ids=p_m + p_t), self.conn)
+        self.assertEqual(len(z), len(z_list))
+        self.assertGreater(len(z), 0)
+
+    def test_build_process_exchanges(self):
+        p_m = ['f22f5f6e-1bdc-3cb5-8f48-8a04d8f9b768']
+        ex_sql = sq.build_process_exchanges(process_ref_ids=p_m)
+        z = pd.read_sql(ex_sql, self.conn)
+        self.assertEqual(set(z.FLOW_TYPE), {'PRODUCT_FLOW', 'ELEMENTARY_FLOW'})
@@ -10,3 +10,35 @@ class TestUtils(TestCase):
         p = {'a': pd.DataFrame({'b': 1, 'c': 2}, index=[0])}
         d = mu.get_index_value(p)
         self.assertEqual(len(d), 1)
+
+    def test_ref_id_map(self):
+        ref_id_map = mu.RefIdMap(['P', 'F'])
+        self.assertEqual(ref_id_map.get_key('p1'), 0)
+        self.assertEqual(ref_id_map.get_key('f1'), 1)
+        self.assertEqual(ref_id_map.get_key('p1'), 0)
+        index = pd.MultiIndex.from_tuples([(1, 0, 't1')], names=['F', 'P', 'T'])
+        self.assertEqual(list(ref_id_map.get_ref_id_index(index)), [('f1', 'p1', 't1')])
+
+    def test_parameter_table(self):
+        index_value = [{'index': ['f1', 'p1'], 'value': 0}, {'index': ['f1', 'p2'], 'value': 2},
+                       {'index': ['f2', 'p1'], 'value': 0}]
+        table = mu.ParameterTable.from_index_value(index_value)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.to_index_value(), index_value)
+        self.assertEqual(table.get(('f1', 'p2')), 2)
+        self.assertIsNone(table.get(('f3', 'p1')))
+        self.assertEqual(mu.ParameterTable.from_frame(table.to_frame()).to_dict(), table.to_dict())
+        pd.testing.assert_frame_equal(table.to_frame(), pd.DataFrame({
+            'Index': [iv['index'] for iv in index_value], 'Value': [iv['value'] for iv in index_value]}))
+        self.assertEqual(table.get_nonzero().to_dict(), {('f1', 'p2'): 2})
+
+        # updates keep the defaults of other indices and upcast the values
+        table.update(mu.ParameterTable.from_index_value([{'index': ['f2', 'p1'], 'value': 1.5},
+                                                         {'index': ['f3', 'p1'], 'value': 1}]))
+        self.assertEqual(table.to_dict(), {('f1', 'p1'): 0, ('f1', 'p2'): 2, ('f2', 'p1'): 1.5})
+
+        # mixed values are not coerced to strings
+        table = mu.ParameterTable([('f1', 'p1'), ('f1', 'p2')], [0, 'kg'])
+        self.assertEqual(table.to_index_value(), [{'index': ['f1', 'p1'], 'value': 0},
+                                                  {'index': ['f1', 'p2'], 'value': 'kg'}])
+        self.assertEqual(table.get_nonzero().to_dict(), {('f1', 'p2'): 'kg'})
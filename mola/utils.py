@@ -1,6 +1,7 @@
 """
 Utility functions for mola
 """
+import numpy as np
 import pandas as pd
 import json
 
@@ -13,19 +14,61 @@ def get_index_value(df_dict, value_key='value'):
     :param str value_key: name of value key in dicts
     :return: dict
     """
-    def fiv(g): return {'index': g[0], value_key: g[1]}
     d = {}
     for k, df in df_dict.items():
         if len(df) > 0:
             # index value df
             if df.shape[1] == 2:
-                d[k] = list(df.apply(fiv, axis=1))
+                d[k] = ParameterTable.from_frame(df).to_index_value(value_key)
             # scalar df
             else:
                 d[k] = df.Value.iloc[0]
     return d
 
 
+def get_parameter_tables(df_dict):
+    """
+    Turn dict of DataFrames into a dict of ParameterTables or values without building index value dicts.
+
+    :param dict df_dict: dictionary of DataFrames
+    :return: dict
+    """
+    d = {}
+    for k, df in df_dict.items():
+        if len(df) > 0:
+            if df.shape[1] == 2:
+                d[k] = ParameterTable.from_frame(df)
+            else:
+                d[k] = df.Value.iloc[0]
+    return d
+
+
+def get_value_array(values):
+    """
+    Get parameter values as a numeric array, or as an object array if any value is not numeric so that
+    mixed values such as 0 and 'kg' are not coerced to strings.
+
+    :param values: sequence of values
+    :return: numpy array
+    """
+    values = values if isinstance(values, np.ndarray) else list(values)
+    array = np.asarray(values)
+    if array.dtype.kind not in 'biuf':
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+    return array
+
+
+def get_index_key(index):
+    """
+    Get a hashable key for a parameter index in index-value form.
+
+    :param index: list of set elements or a single set element
+    :return: tuple or set element
+    """
+    return tuple(index) if isinstance(index, list) else index
+
+
 def unnest(df, explode):
     cols = df.columns.tolist()
     idx = df.index.repeat(df[explode[0]].str.len())
@@ -50,6 +93,167 @@ def make_config(sets_json, parameters_json, config_json='config/model_config.jso
     return config
 
 
+class RefIdMap:
+    """
+    Map openLCA reference ids to compact integer keys and back
+    """
+
+    def __init__(self, set_names=()):
+        self.set_names = set(set_names)
+        self.ref_ids = []
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.ref_ids)
+
+    def get_key(self, ref_id):
+        """
+        Get the integer key of a reference id, adding it to the map if it is new.
+
+        :param str ref_id: reference id
+        :return: int
+        """
+        key = self.keys.get(ref_id)
+        if key is None:
+            key = self.keys[ref_id] = len(self.ref_ids)
+            self.ref_ids.append(ref_id)
+        return key
+
+    def get_ref_id(self, key):
+        """
+        Get the reference id of an integer key.
+
+        :param int key: integer key
+        :return: str
+        """
+        return self.ref_ids[key]
+
+    def get_ref_id_index(self, index):
+        """
+        Replace integer keys with reference ids in the levels of a pandas index named by a set in set_names.
+
+        :param pandas.Index index: index of integer keys
+        :return: pandas.Index
+        """
+        if isinstance(index, pd.MultiIndex):
+            for i, name in enumerate(index.names):
+                if name in self.set_names:
+                    index = index.set_levels(index.levels[i].map(self.get_ref_id), level=i)
+        elif index.name in self.set_names:
+            index = index.map(self.get_ref_id)
+        return index
+
+
+class ParameterTable:
+    """
+    Columnar store of an indexed parameter as a list of index tuples and an array of values.
+    Converts to and from the index-value form of configurations and the Index/Value DataFrames of the editors.
+    """
+
+    def __init__(self, index=(), values=()):
+        self.index = list(index)
+        self.values = get_value_array(values) if len(self.index) > 0 else np.array([])
+        self._positions = None
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_index_value(cls, index_value, value_key='value'):
+        """
+        Create a ParameterTable from a list of index value dicts.
+
+        :param list index_value: list of dicts with index and value keys
+        :param str value_key: name of value key in dicts
+        :return: ParameterTable
+        """
+        return cls([get_index_key(iv['index']) for iv in index_value], [iv[value_key] for iv in index_value])
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Create a ParameterTable from a DataFrame with index and value columns, such as Index and Value.
+
+        :param DataFrame df: parameter DataFrame
+        :return: ParameterTable
+        """
+        return cls(map(get_index_key, df.iloc[:, 0]), df.iloc[:, 1].to_numpy())
+
+    def to_index_value(self, value_key='value'):
+        """
+        Get the parameter as a list of index value dicts.
+
+        :param str value_key: name of value key in dicts
+        :return: list
+        """
+        return [{'index': list(index) if isinstance(index, tuple) else index, value_key: value}
+                for index, value in zip(self.index, self.values.tolist())]
+
+    def to_frame(self):
+        """
+        Get the parameter as a DataFrame with Index and Value columns, in the layout of the editor frames with
+        indices as lists of set elements.
+
+        :return: DataFrame
+        """
+        return pd.DataFrame({'Index': [list(index) if isinstance(index, tuple) else index for index in self.index],
+                             'Value': self.values.tolist()})
+
+    def to_dict(self):
+        """
+        Get the parameter as a dict of values keyed by index tuples, as used by a DataPortal.
+
+        :return: dict
+        """
+        return dict(zip(self.index, self.values.tolist()))
+
+    def get(self, index, default=None):
+        """
+        Get the value of an index.
+
+        :param index: index tuple
+        :param default: value returned if the index is not in the table
+        :return: value
+        """
+        position = self.get_positions().get(index)
+        return default if position is None else self.values[position]
+
+    def get_positions(self):
+        """
+        Get the positions of the indices in the table, built once on first use.
+
+        :return: dict of positions keyed by index
+        """
+        if self._positions is None:
+            self._positions = {index: i for i, index in enumerate(self.index)}
+        return self._positions
+
+    def get_nonzero(self):
+        """
+        Get a ParameterTable holding the nonzero values.
+
+        :return: ParameterTable
+        """
+        mask = self.values != 0
+        return ParameterTable([index for index, nonzero in zip(self.index, mask) if nonzero], self.values[mask])
+
+    def update(self, other):
+        """
+        Set the values of the indices of another ParameterTable that are in this table, the last value of
+        a repeated index wins.
+
+        :param ParameterTable other: new values
+        :return: None
+        """
+        positions = self.get_positions()
+        matches = {positions[index]: value for index, value in zip(other.index, other.values.tolist())
+                   if index in positions}
+        if len(matches) > 0:
+            values = get_value_array(matches.values())
+            self.values = self.values.astype(np.result_type(self.values, values))
+            self.values[list(matches)] = values
+
+
 class Package:
     """
     Package settings
@@ -29,7 +29,7 @@ class Controller(QWidget):
         if 'indexed_sets' in user_config:
             self.indexed_sets.update(user_config['indexed_sets'])
         self.parameters = self.spec.get_default_parameters(self.sets, self.indexed_sets)
-        self.parameters.update(user_config['parameters'])
+        mb.update_parameters(self.parameters, user_config['parameters'], self.spec)
 
         # if we need a db get lookups
         self.db_file = user_config['db_file']
@@ -49,6 +49,9 @@ class Controller(QWidget):
         :return: dict
         """
         self.update_state()
+        parameters = self.parameters
+        if self.spec.settings.get('sparse_parameters'):
+            parameters = mb.get_sparse_parameters(parameters, self.spec)
         config = {
             'settings': self.spec.settings,
             'doc_path': self.user_config['doc_path'],
@@ -57,7 +60,7 @@ class Controller(QWidget):
             'db_file': self.db_file,
             'sets': self.sets,
             'indexed_sets': self.indexed_sets,
-            'parameters': self.parameters,
+            'parameters': parameters,
         }
 
         return config
@@ -79,7 +82,7 @@ class CustomController(Controller):
                                            self.spec, self.lookup, self.conn)
         p = {k: v for k, v in self.parameters.items() if k != 'J'}
         self.parameters_editor = mw.ParametersEditor(self.sets, p, self.spec, self.lookup)
-        self.model_run = mr.ModelRun(self.lookup)
+        self.model_run = mr.ModelRun(self.lookup, self.spec)
         self.model_build = mqb.ModelBuild(self)
 
         # initialize tab screen
@@ -130,7 +133,7 @@ class StandardController(Controller):
                                                          self.spec, self.lookup)
 
 
-        self.model_run = mr.ModelRun(self.lookup)
+        self.model_run = mr.ModelRun(self.lookup, self.spec)
         self.model_build = mqb.ModelBuild(self)
 
         # initialize tab screen
@@ -13,12 +13,13 @@ from molaqt.dialogs import critical_error_box
 
 class ModelRun(QWidget):
 
-    def __init__(self, lookup):
+    def __init__(self, lookup, spec=None):
 
         super().__init__()
         self._concrete_model = None
         self.results = None
         self.lookup = lookup
+        self.spec = spec
 
         # button
         self.run_button = QPushButton("Run")
@@ -69,18 +70,33 @@ class ModelRun(QWidget):
         print('Concrete model changed in ModelRun')
         self._concrete_model = model
         self.objectives = {}
+        self.objective_combobox.blockSignals(True)
         self.objective_combobox.clear()
-        for i, obj in enumerate(model.component_objects(pe.Objective)):
-            self.objective_combobox.addItem(obj.name)
-            # activate first objective
-            if i == 0:
-                obj.activate()
-            else:
-                obj.deactivate()
+        # objectives left out of a lazy build are listed from the specification
+        if hasattr(self.spec, 'objective_declarations'):
+            objective_names = list(self.spec.objective_declarations)
+        else:
+            objective_names = [obj.name for obj in model.component_objects(pe.Objective)]
+        self.objective_combobox.addItems(objective_names)
+
+        # select first built objective
+        built_names = [obj.name for obj in model.component_objects(pe.Objective)]
+        if len(built_names) > 0:
+            self.objective_combobox.setCurrentIndex(objective_names.index(built_names[0]))
+        self.objective_combobox.blockSignals(False)
+        self.objective_changed()
 
     def objective_changed(self):
-        for i, obj in enumerate(self._concrete_model.component_objects(pe.Objective)):
-            if i == self.objective_combobox.currentIndex():
+        name = self.objective_combobox.currentText()
+        if self._concrete_model is None or name == '':
+            return
+
+        # build objective on demand
+        if self._concrete_model.component(name) is None:
+            self.spec.build_objective(self._concrete_model, name)
+
+        for obj in self._concrete_model.component_objects(pe.Objective):
+            if obj.name == name:
                 obj.activate()
             else:
                 obj.deactivate()
@@ -510,8 +510,8 @@ class ParametersEditor(QWidget):
     def rebuild_clicked(self):
         print("Clicked rebuild button")
 
-        # get parameters state in index value form
-        p = mu.get_index_value(self.par)
+        # get parameters state as ParameterTables
+        p = mu.get_parameter_tables(self.par)
 
         # rebuild parameters as a dict of DataFrames
         self.par = mb.build_parameters(self.sets, p, self.spec, indexed_sets=self.get_indexed_sets())
@@ -1012,7 +1012,14 @@ class ConfigurationWidget(QWidget):
             if v['type'] == 'boolean':
                 self.widget[k] = QCheckBox(v['doc'])
                 self.widget[k].setChecked(self.spec.settings[k])
-                self.widget[k].stateChanged.connect(lambda: self.boolean_state(self.widget[k], k))
+                self.widget[k].stateChanged.connect(lambda state, k=k: self.boolean_state(self.widget[k], k))
+                layout.addWidget(self.widget[k])
+            elif v['type'] == 'choice':
+                self.widget[k] = QComboBox()
+                self.widget[k].addItems(v['choices'])
+                self.widget[k].setCurrentText(self.spec.settings[k])
+                self.widget[k].currentTextChanged.connect(partial(self.choice_state, k))
+                layout.addWidget(QLabel(v['doc']))
                 layout.addWidget(self.widget[k])
 
         self.setLayout(layout)
@@ -1020,6 +1027,9 @@ class ConfigurationWidget(QWidget):
     def boolean_state(self, bw, setting):
         self.spec.settings[setting] = bw.isChecked()
 
+    def choice_state(self, setting, text):
+        self.spec.settings[setting] = text
+
 
 class LinkParameterDiagram:
 